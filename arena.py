@@ -0,0 +1,255 @@
+"""
+Headless arena: play agents against each other in-process, with the rules of local_server.py, to compare their
+strength and the time they take.
+
+    python arena.py -t connect_4 --games 200 r m50 "m300 -b 32"
+
+Each player is given as the -a argument of main.py followed by any other arguments of main.py. Every pair of players
+plays the given number of games, each of them starting half of them, and the games are split between worker
+processes. The report gives the score of each player with a confidence interval, Elo ratings fitted to all the
+results, the thinking time per move, and the games each player lost by crashing or by playing an invalid move.
+
+The thinking time is CPU time, including the worker processes of agents searching with -w. These are only counted
+when the agent is closed at the end of each game, so the time of a game that crashes the arena worker is lost.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import random
+import shlex
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from local_server import GAME_TYPES
+from main import make_agent, make_parser, new_state
+
+# z of the confidence intervals of the scores (95%)
+CONFIDENCE_Z = 1.96
+
+# Ratings are relative, the average rating is set to this
+MEAN_ELO = 1500
+
+# Usernames of the two players of a game, by the order they join it in
+SEATS = ('player_0', 'player_1')
+
+# How a player lost a game other than by being beaten, see play_arena_game
+CRASH = 'crash'
+INVALID = 'invalid'
+
+
+def make_player(game_type: str, spec: str, username: str):
+    """
+    :param spec: -a argument of main.py, followed by any other arguments of main.py, e.g. "m300 -b 32"
+    :return: a new agent
+    """
+    (agent, *args) = shlex.split(spec)
+    parsed_args = make_parser().parse_args(['-t', game_type, '-a', agent, '-u', username] + args)
+    player = make_agent(parsed_args, username)
+    if player is None:
+        raise ValueError("Agent {} not found for {}".format(agent, game_type))
+    return player
+
+
+def children_cpu_time() -> float:
+    """ CPU time of the child processes that have exited, in seconds """
+    times = os.times()
+    return times.children_user + times.children_system
+
+
+def play_arena_game(game_type: str, specs: Tuple[str, str],
+                    seed: int) -> Tuple[List[int], List[float], List[int], List[Optional[Tuple[str, str]]]]:
+    """
+    Play one game between two players, the first one joining first. Agents aren't asked to ponder, since they would
+    take CPU time from their opponent. A player whose agent fails or plays an invalid move loses.
+
+    :param specs: the two players, see make_player
+    :param seed: seed of the random generator, for the agents and the game
+    :return: the seats of the winners, the thinking time of each player in CPU seconds, the number of moves of each
+             player, and for each player None, or (CRASH, traceback) if its agent raised an exception, or
+             (INVALID, move) if it played an invalid move
+    """
+    random.seed(seed)
+    game = GAME_TYPES[game_type]()
+    agents = {}
+    states = {}
+    times = {username: 0.0 for username in SEATS}
+    moves = {username: 0 for username in SEATS}
+    failures = {username: None for username in SEATS}
+    try:
+        for (username, spec) in zip(SEATS, specs):
+            agents[username] = make_player(game_type, spec, username)
+            states[username] = new_state(game_type)
+            game.join(username)
+        while game.stage == "in_progress":
+            # The agents are given the state as they would get it from the server
+            encoded = json.dumps(game.encode())
+            for username in list(game.can_move):
+                states[username].update_game_state(json.loads(encoded))
+                start = time.process_time()
+                try:
+                    move = agents[username].get_next_move(states[username]).encode_game_move()
+                    if not game.submit(username, move):
+                        failures[username] = (INVALID, move)
+                except Exception:
+                    failures[username] = (CRASH, traceback.format_exc())
+                times[username] += time.process_time() - start
+                moves[username] += 1
+                if failures[username] is not None:
+                    game.end([other for other in SEATS if other != username])
+                    break
+    finally:
+        for (username, agent) in agents.items():
+            # The worker processes of the agent exit when it is closed, and only then is their CPU time known
+            start = children_cpu_time()
+            agent.close()
+            times[username] += children_cpu_time() - start
+    return ([SEATS.index(username) for username in game.winners], [times[username] for username in SEATS],
+            [moves[username] for username in SEATS], [failures[username] for username in SEATS])
+
+
+def _play_games(game_type: str, specs: Tuple[str, str], seeds: List[int]):
+    # The agents print their search statistics for every move
+    with contextlib.redirect_stdout(io.StringIO()):
+        return [play_arena_game(game_type, specs, seed) for seed in seeds]
+
+
+def wilson_interval(score: float, games: int, z: float = CONFIDENCE_Z) -> Tuple[float, float]:
+    """ Wilson score interval of a proportion [score] out of [games] """
+    if games == 0:
+        return (0.0, 1.0)
+    p = score / games
+    center = (p + z * z / (2 * games)) / (1 + z * z / games)
+    half_width = z * math.sqrt(p * (1 - p) / games + z * z / (4 * games * games)) / (1 + z * z / games)
+    return (max(0.0, center - half_width), min(1.0, center + half_width))
+
+
+def fit_elo(scores: Dict[Tuple[int, int], float], games: Dict[Tuple[int, int], int], players: int,
+            iterations: int = 1000) -> List[float]:
+    """
+    Maximum likelihood Elo ratings (Bradley-Terry model, draws counted as half a win)
+
+    :param scores: (i, j) -> total score of player i in its games against player j
+    :param games: (i, j) -> number of games between players i and j, for i < j
+    :return: the rating of each player, with an average of MEAN_ELO
+    """
+    # One virtual draw between every pair keeps the ratings finite when a player wins all its games
+    scores = {pair: score + 0.5 for (pair, score) in scores.items()}
+    games = {pair: count + 1 for (pair, count) in games.items()}
+    total_scores = [sum(score for ((i, _), score) in scores.items() if i == player) for player in range(players)]
+    # Strength of each player, 10 ** (rating / 400), found with the MM algorithm, which always converges
+    strengths = [1.0] * players
+    for _ in range(iterations):
+        denominators = [0.0] * players
+        for ((i, j), count) in games.items():
+            denominators[i] += count / (strengths[i] + strengths[j])
+            denominators[j] += count / (strengths[i] + strengths[j])
+        strengths = [score / denominator for (score, denominator) in zip(total_scores, denominators)]
+        # Only the ratios matter, keep the strengths around 1
+        norm = math.exp(sum(math.log(strength) for strength in strengths) / players)
+        strengths = [strength / norm for strength in strengths]
+    ratings = [400 * math.log10(strength) for strength in strengths]
+    mean = sum(ratings) / players
+    return [rating - mean + MEAN_ELO for rating in ratings]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play agents against each other, without the server.")
+    parser.add_argument('players', type=str, nargs='+',
+                        help="the players, each as the -a argument of main.py followed by other arguments of main.py")
+    parser.add_argument('-t', '--type', type=str, default='connect_4', choices=sorted(GAME_TYPES),
+                        help="type of game")
+    parser.add_argument('--games', type=int, default=100, help="number of games played by each pair of players")
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument('--chunk', type=int, default=10, help="number of games sent to a worker at once")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the games")
+    args = parser.parse_args(sys.argv[1:])
+    players = len(args.players)
+    if players < 2:
+        parser.error("at least two players are needed")
+    # Fail early on unknown players
+    for spec in args.players:
+        make_player(args.type, spec, SEATS[0]).close()
+
+    rng = random.Random(args.seed)
+    # (players of the game by seat, seeds) for each chunk of games
+    tasks = []
+    for i in range(players):
+        for j in range(i + 1, players):
+            for (seats, count) in (((i, j), (args.games + 1) // 2), ((j, i), args.games // 2)):
+                seeds = [rng.getrandbits(64) for _ in range(count)]
+                tasks += [(seats, seeds[k:k + args.chunk]) for k in range(0, count, args.chunk)]
+
+    scores = {(i, j): 0.0 for i in range(players) for j in range(players) if i != j}
+    games = {(i, j): 0 for i in range(players) for j in range(i + 1, players)}
+    times = [0.0] * players
+    moves = [0] * players
+    crashes = [0] * players
+    invalid = [0] * players
+    # First traceback of each player that crashed
+    tracebacks = {}
+    start = time.monotonic()
+    with ProcessPoolExecutor(max_workers=args.processes) as executor:
+        futures = [(seats, executor.submit(_play_games, args.type, (args.players[seats[0]], args.players[seats[1]]),
+                                           seeds)) for (seats, seeds) in tasks]
+        played = 0
+        for (seats, future) in futures:
+            for (winners, game_times, game_moves, failures) in future.result():
+                (a, b) = seats
+                # A win for both or for nobody is a draw
+                score = 0.5 if len(winners) != 1 else float(winners == [0])
+                scores[(a, b)] += score
+                scores[(b, a)] += 1 - score
+                games[(min(a, b), max(a, b))] += 1
+                for (seat, player) in enumerate(seats):
+                    times[player] += game_times[seat]
+                    moves[player] += game_moves[seat]
+                    if failures[seat] is None:
+                        continue
+                    (kind, detail) = failures[seat]
+                    if kind == CRASH:
+                        crashes[player] += 1
+                        tracebacks.setdefault(player, detail)
+                    else:
+                        invalid[player] += 1
+                played += 1
+            print("{} games played".format(played), end='\r', flush=True)
+    elapsed = time.monotonic() - start
+    print()
+
+    ratings = fit_elo(scores, games, players)
+    print("{} games in {:.1f}s, {:.1f} games/s".format(played, elapsed, played / elapsed))
+    print("{:>4} {:>24} {:>7} {:>7} {:>15} {:>7} {:>10} {:>10} {:>8} {:>8}".format(
+        "rank", "player", "games", "score", "95% interval", "elo", "ms/move", "cpu s", "crashes", "invalid"))
+    for (rank, player) in enumerate(sorted(range(players), key=lambda p: -ratings[p])):
+        player_games = sum(count for (pair, count) in games.items() if player in pair)
+        player_score = sum(score for ((i, _), score) in scores.items() if i == player)
+        (low, high) = wilson_interval(player_score, player_games)
+        print("{:>4} {:>24} {:>7} {:>6.1f}% {:>6.1f}%-{:>5.1f}% {:>7.0f} {:>10.2f} {:>10.1f} {:>8} {:>8}".format(
+            rank + 1, args.players[player][:24], player_games, 100 * player_score / max(1, player_games), 100 * low,
+            100 * high, ratings[player], 1000 * times[player] / max(1, moves[player]), times[player],
+            crashes[player], invalid[player]))
+    print()
+    print("Score of the row player against the column player:")
+    print("{:>24} ".format("") + " ".join("{:>10}".format(spec[:10]) for spec in args.players))
+    for i in range(players):
+        row = []
+        for j in range(players):
+            count = games[(min(i, j), max(i, j))] if i != j else 0
+            row.append("{:>9.1f}%".format(100 * scores[(i, j)] / count) if count > 0 else "{:>10}".format("-"))
+        print("{:>24} ".format(args.players[i][:24]) + " ".join(row))
+    # Crashes are usually a broken agent or configuration, rather than a weak player
+    for (player, text) in sorted(tracebacks.items()):
+        print(file=sys.stderr)
+        print("{} crashed in {} games, the first time with:".format(args.players[player], crashes[player]),
+              file=sys.stderr)
+        print(text, file=sys.stderr, end='')
+
+
+if __name__ == '__main__':
+    main()
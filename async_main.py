@@ -0,0 +1,120 @@
+"""
+Play many games at once from a single process, with the asyncio client. Takes the same arguments as main.py, plus
+the number of games to play, except the metrics and profiling ones.
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+import clientlib.async_wrapper as async_wrapper
+from clientlib.recording import GameRecorder
+
+from main import make_agent, make_parser, new_state
+
+
+def _no_progress(username, game_id, event, moves):
+    pass
+
+
+def check_args(parser: argparse.ArgumentParser, parsed_args: argparse.Namespace):
+    """
+    Reject the arguments of main.py that can't be honoured with many games in a process: the metrics and profiles
+    are recorded turn by turn, which can't be told apart between games played at once
+    """
+    if (parsed_args.metrics_log or parsed_args.metrics_csv is not None or parsed_args.metrics_prometheus is not None
+            or len(parsed_args.profile_move) > 0):
+        parser.error("--metrics-log, --metrics-csv, --metrics-prometheus and --profile-move are only supported by "
+                     "main.py, which plays a single game")
+
+
+async def play_game(agent, username, game_id, game_type, session, progress=_no_progress, record_dir=None):
+    """
+    Same as main.play_game, with the requests of the other games sent while this one waits
+
+    :param progress: called as progress(username, game_id, event, moves) when the game has been joined ('joined'),
+                     after each of our moves ('move'), and at the end of the game ('won' or 'lost'), with the number
+                     of moves we have played
+    :param record_dir: if given, the game is recorded in it, see main.play_game
+    :return: whether the game was won
+    """
+    loop = asyncio.get_running_loop()
+    # Create game ?
+    if game_id is None or game_id[0:5] != "game_":
+        game_id = await async_wrapper.AsyncGameClient.create_game(game_type, session)
+    print("{}: using game_id {}".format(username, game_id))
+    recorder = None
+    if record_dir is not None:
+        recorder = GameRecorder(os.path.join(record_dir, "{}_{}.jsonl".format(game_id, username)), game_type,
+                                game_id, username)
+    try:
+        client = async_wrapper.AsyncGameClient(game_type, game_id, username, session, recorder=recorder)
+        await client.join_game()
+        progress(username, game_id, 'joined', 0)
+        moves = 0
+        state = new_state(game_type)
+        await client.update_state(state)
+        while state.is_waiting_for_start():
+            while not await client.wait_for_state(state):
+                continue
+        while state.is_in_progress():
+            if state.player_can_move(client.username):
+                # The agents are blocking, so they think in a thread to let the other games go on meanwhile
+                move = await loop.run_in_executor(None, agent.get_next_move, state)
+                await client.submit_move(move=move)
+                moves += 1
+                progress(username, game_id, 'move', moves)
+            else:
+                agent.ponder(state)
+            while not await client.wait_for_state(state):
+                continue
+            agent.stop_pondering()
+        won = client.username in state.winners
+        print("{}: {} {}".format(username, game_id, "won" if won else "lost"))
+        progress(username, game_id, 'won' if won else 'lost', moves)
+        return won
+    finally:
+        agent.close()
+        if recorder is not None:
+            recorder.close()
+
+
+async def play_games(games, pool_size: int, progress=_no_progress):
+    """
+    Play games at once, sharing one connection pool
+
+    :param games: list of (agent, username, game_id, game_type, record_dir) tuples, as taken by play_game
+    :param pool_size: number of connections kept open to the server
+    :param progress: see play_game
+    :return: list of whether each game was won, or the exception it raised
+    """
+    async with async_wrapper.make_async_session(pool_size) as session:
+        return await asyncio.gather(*(play_game(agent, username, game_id, game_type, session, progress, record_dir)
+                                      for (agent, username, game_id, game_type, record_dir) in games),
+                                    return_exceptions=True)
+
+
+if __name__ == '__main__':
+    parser = make_parser()
+    parser.add_argument('-n', '--games', type=int, default=1,
+                        help="number of games to play at once. The username of the bot in the i-th game is "
+                             "<username>_<i>.")
+    parsed_args = parser.parse_args(sys.argv[1:])
+    check_args(parser, parsed_args)
+    if parsed_args.type not in ("connect_4", "snake"):
+        print("Game type invalid")
+        sys.exit(1)
+    games = []
+    for i in range(parsed_args.games):
+        username = "{}_{}".format(parsed_args.username, i) if parsed_args.games > 1 else parsed_args.username
+        agent = make_agent(parsed_args, username)
+        if agent is None:
+            print("Agent not found")
+            sys.exit(1)
+        games.append((agent, username, parsed_args.game, parsed_args.type, parsed_args.record))
+    # Every game waiting for an update holds a connection
+    results = asyncio.run(play_games(games, pool_size=max(parsed_args.games, 1)))
+    print("Won {} out of {} games".format(sum(result is True for result in results), len(results)))
+    for result in results:
+        if isinstance(result, Exception):
+            print("Game failed: {!r}".format(result))
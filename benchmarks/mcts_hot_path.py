@@ -0,0 +1,208 @@
+"""
+Benchmark of the MCTS hot path: throughput of the functions of connect_4/mcts.py called for every node or playout,
+and end-to-end playouts per second on fixed positions. Everything is seeded, so that runs on different commits do the
+same work and can be compared.
+
+Run from the root of the repository with
+    python -m benchmarks.mcts_hot_path [--out results.json] [--compare baseline.json]
+
+With --compare, the exit status is 1 if any benchmark has regressed by more than the threshold.
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Tuple
+
+from connect_4.bitboard import Bitboard
+from connect_4.mcts import check_win, expand, get_opponent, iterate, rollout, step, valid_moves
+from connect_4.tree import SearchTree
+
+# Positions searched end to end: the empty board, and the positions of the __main__ block of mcts.py, numbered in
+# their order there, except the first one, which X has already won
+POSITIONS = {
+    'empty': [[], [], [], [], [], [], []],
+    'main_2': [[],
+               ['X'],
+               [],
+               ['O', 'X'],
+               ['X', 'O', 'X'],
+               ['O', 'O', 'O'],
+               ['X', 'O']],
+    'main_3': [[],
+               ['O'],
+               [],
+               ['X', 'O', 'O', 'X'],
+               ['O', 'X', 'X'],
+               ['O', 'X'],
+               []],
+    'main_4': [['O', 'O'],
+               ['O', 'X', 'O', 'X'],
+               ['X'],
+               ['O', 'X', 'X', 'X'],
+               ['X', 'O', 'O'],
+               ['X', 'X', 'X', 'O'],
+               ['O']],
+}
+
+# A change of throughput bigger than this against the baseline is reported as a regression or an improvement
+DEFAULT_THRESHOLD = 0.10
+
+
+def turn_of(state: List[List[str]]) -> str:
+    """ Player to move: the one with fewer discs, or 'O' if they have as many """
+    discs = [disc for col in state for disc in col]
+    return 'X' if discs.count('O') > discs.count('X') else 'O'
+
+
+def random_positions(count: int, rng: random.Random) -> List[Tuple[Bitboard, str]]:
+    """ Positions of games played randomly up to a random number of moves, with the player who has just played """
+    positions = []
+    while len(positions) < count:
+        board = Bitboard()
+        player = 'X'
+        for _ in range(rng.randrange(0, 30)):
+            (moves, _) = valid_moves(board)
+            if len(moves) == 0:
+                break
+            player = get_opponent(player)
+            board.play(rng.choice(moves), player)
+        if check_win(board) is None:
+            positions.append((board, player))
+    return positions
+
+
+def time_calls(function: Callable, arguments: List[tuple], repeat: int) -> float:
+    """
+    :return: the best time over [repeat] runs of calling function with each of the arguments, in seconds per call
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for args in arguments:
+            function(*args)
+        best = min(best, time.perf_counter() - start)
+    return best / len(arguments)
+
+
+def micro_benchmarks(positions: List[Tuple[Bitboard, str]], repeat: int, seed: int) -> Dict[str, float]:
+    """ :return: calls per second of each function of the hot path """
+    boards = [board for (board, _) in positions]
+    results = {}
+    results['check_win'] = time_calls(check_win, [(board,) for board in boards], repeat)
+    results['valid_moves'] = time_calls(valid_moves, [(board,) for board in boards], repeat)
+    moves = [(board, get_opponent(player), valid_moves(board)[0][0]) for (board, player) in positions]
+    results['step_copy'] = time_calls(step, [(board, turn, move, True) for (board, turn, move) in moves], repeat)
+    # Playing in place changes the board, so every run is given fresh copies, made before timing it
+    best = float('inf')
+    for _ in range(repeat):
+        arguments = [(board.copy(), turn, move) for (board, turn, move) in moves]
+        best = min(best, time_calls(step, arguments, 1))
+    results['step_in_place'] = best
+    best = float('inf')
+    for _ in range(repeat):
+        random.seed(seed)
+        arguments = [(board.copy(), player) for (board, player) in positions]
+        best = min(best, time_calls(rollout, arguments, 1))
+    results['rollout'] = best
+    # Expansion of the root of a new tree in each position, timed alone
+    tree = SearchTree()
+    best = float('inf')
+    for _ in range(repeat):
+        random.seed(seed)
+        total = 0.0
+        for (board, player) in positions:
+            tree.clear()
+            tree.set_root(board, player)
+            start = time.perf_counter()
+            expand(tree, [tree.root], tree.root_state.copy())
+            total += time.perf_counter() - start
+        best = min(best, total / len(positions))
+    results['expand'] = best
+    return {name: 1 / seconds for (name, seconds) in results.items()}
+
+
+def end_to_end_benchmarks(playouts: int, seed: int) -> Dict[str, float]:
+    """ :return: playouts per second of MCTS from each of POSITIONS, searching a new tree for [playouts] playouts """
+    tree = SearchTree()
+    results = {}
+    for (name, state) in POSITIONS.items():
+        random.seed(seed)
+        tree.clear()
+        tree.set_root(Bitboard.from_O_X(state), get_opponent(turn_of(state)))
+        start = time.perf_counter()
+        done = iterate(tree, float('inf'), max_playouts=playouts)
+        results[name] = done / (time.perf_counter() - start)
+    return results
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> List[str]:
+    """ :return: one line per benchmark, with its change against the baseline, flagged if beyond the threshold """
+    lines = []
+    for section in ('micro', 'end_to_end'):
+        for (name, value) in results[section].items():
+            old = baseline.get(section, {}).get(name)
+            if old is None:
+                continue
+            change = value / old - 1
+            flag = "REGRESSION" if change < -threshold else "improvement" if change > threshold else ""
+            lines.append("{:>12} {:>14} {:>14.0f} {:>14.0f} {:>+8.1f}% {}".format(
+                section, name, old, value, 100 * change, flag))
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the MCTS hot path.")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the positions and of the searches")
+    parser.add_argument('--positions', type=int, default=2000, help="number of positions of the micro benchmarks")
+    parser.add_argument('--repeat', type=int, default=5, help="runs of each micro benchmark, the best one is kept")
+    parser.add_argument('--playouts', type=int, default=20000, help="playouts of each end-to-end search")
+    parser.add_argument('--out', type=str, help="file to write the results to, as JSON (default: standard output)")
+    parser.add_argument('--compare', type=str, help="JSON results of a previous run to compare with")
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help="relative change flagged as a regression or an improvement")
+    args = parser.parse_args(sys.argv[1:])
+
+    positions = random_positions(args.positions, random.Random(args.seed))
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'parameters': {'seed': args.seed, 'positions': args.positions, 'repeat': args.repeat,
+                       'playouts': args.playouts},
+        # Calls per second
+        'micro': micro_benchmarks(positions, args.repeat, args.seed),
+        # Playouts per second
+        'end_to_end': end_to_end_benchmarks(args.playouts, args.seed),
+    }
+    output = json.dumps(results, indent=2)
+    if args.out is not None:
+        with open(args.out, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+    if args.compare is not None:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        print("{:>12} {:>14} {:>14} {:>14} {:>9}".format("section", "benchmark", "baseline/s", "now/s", "change"),
+              file=sys.stderr)
+        lines = compare(results, baseline, args.threshold)
+        for line in lines:
+            print(line, file=sys.stderr)
+        if any(line.endswith("REGRESSION") for line in lines):
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
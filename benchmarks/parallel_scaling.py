@@ -0,0 +1,82 @@
+"""
+Scaling benchmark of the parallel MCTS modes: playouts per second against the number of worker processes.
+
+Run from the root of the repository with
+    python -m benchmarks.parallel_scaling [--time T] [--max-workers N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from connect_4.bitboard import Bitboard
+from connect_4.mcts import get_opponent
+from connect_4.parallel import root_parallel_statistics, leaf_parallel_search
+from connect_4.tree import SearchTree
+
+# Positions searched, in the format given by Connect4State.to_O_X, with the player to move
+POSITIONS = [
+    ([[], [], [], [], [], [], []], 'O'),
+    ([['O', 'O'],
+      ['O', 'X', 'O', 'X'],
+      ['X'],
+      ['O', 'X', 'X', 'X'],
+      ['X', 'O', 'O'],
+      ['X', 'X', 'X', 'O'],
+      ['O']], 'O'),
+]
+
+
+def worker_counts(max_workers: int):
+    """ 1, 2, 4, ... up to max_workers """
+    counts = []
+    workers = 1
+    while workers < max_workers:
+        counts.append(workers)
+        workers *= 2
+    return counts + [max_workers]
+
+
+def root_parallel_playouts(executor, workers: int, time_limit: float) -> int:
+    playouts = 0
+    for (state, turn) in POSITIONS:
+        stats = root_parallel_statistics(Bitboard.from_O_X(state), turn, time_limit, False, executor, workers)
+        playouts += sum(visits for (_, visits) in stats.values())
+    return playouts
+
+
+def leaf_parallel_playouts(executor, workers: int, time_limit: float) -> int:
+    playouts = 0
+    for (state, turn) in POSITIONS:
+        tree = SearchTree()
+        root = tree.set_root(Bitboard.from_O_X(state), get_opponent(turn))
+        leaf_parallel_search(tree, time_limit, False, executor, workers)
+        playouts += tree.visits[root]
+    return playouts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Playouts per second of parallel MCTS against core count.")
+    parser.add_argument('--time', type=float, default=2.0, help="search time per position, in seconds")
+    parser.add_argument('--max-workers', type=int, default=os.cpu_count(), help="largest number of workers")
+    args = parser.parse_args(sys.argv[1:])
+    random.seed(0)
+
+    print("{:>8} {:>6} {:>14} {:>8}".format("mode", "cores", "playouts/s", "speedup"))
+    for (mode, playouts_of) in (('root', root_parallel_playouts), ('leaf', leaf_parallel_playouts)):
+        baseline = None
+        for workers in worker_counts(args.max_workers):
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # Start the processes before timing
+                list(executor.map(time.sleep, [0] * workers))
+                start = time.time()
+                playouts = playouts_of(executor, workers, args.time)
+                rate = playouts / (time.time() - start)
+            baseline = baseline or rate
+            print("{:>8} {:>6} {:>14.0f} {:>7.2f}x".format(mode, workers, rate, rate / baseline))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+"""
+Benchmark of the rollout policies of connect_4/mcts.py: how often MCTS with each of them plays a best move, as known
+from the exact solver, for a given number of playouts and for a given CPU time per move, on seeded positions of the
+middle and end of the game. A policy that is slower per rollout has to find better moves with fewer of them to be
+worth it, so the result to look at is the accuracy for a given CPU time.
+
+Run from the root of the repository with
+    python -m benchmarks.rollout_policies [--policies random win_block] [--out results.json]
+
+For the strength in games, with the same time per move:
+    python arena.py -t connect_4 --games 200 m50 "m50 --rollout win_block" "m50 --rollout center"
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from typing import List, Optional, Set, Tuple
+
+from benchmarks.mcts_hot_path import git_commit
+from connect_4.bitboard import Bitboard, BOARD_CELLS
+from connect_4.mcts import best_move, check_win, get_opponent, iterate, valid_moves, ROLLOUT_POLICIES
+from connect_4.solver import Solver
+from connect_4.tree import SearchTree
+
+DEFAULT_PLAYOUTS = (100, 300, 1000, 3000)
+DEFAULT_CPU_TIMES = (0.01, 0.03, 0.1)
+
+
+def best_moves(solver: Solver, board: Bitboard, player: str, time_limit: float) -> Optional[Set[int]]:
+    """
+    :param player: who has just played to get to board
+    :return: the moves of the other player that keep the best result with perfect play, or None if the solver couldn't
+             settle all of them in time, or if one of them wins at once
+    """
+    turn = get_opponent(player)
+    values = {}
+    for move in valid_moves(board)[0]:
+        child = board.copy()
+        child.play(move, turn)
+        if check_win(child) == turn:
+            return None
+        (value, _, exact) = solver.solve(child, player, time_limit)
+        if not exact:
+            return None
+        values[move] = -value
+    best = max(values.values())
+    return {move for (move, value) in values.items() if value == best}
+
+
+def solved_positions(count: int, min_empty: int, max_empty: int, time_limit: float,
+                     rng: random.Random) -> List[Tuple[Bitboard, str, Set[int]]]:
+    """
+    Positions of games played randomly until [min_empty] to [max_empty] cells are left, with the player who has just
+    played and the best moves. Only positions where at most half of the moves are best, without a move winning at once,
+    are kept: otherwise almost any search plays a best move.
+    """
+    solver = Solver()
+    positions = []
+    while len(positions) < count:
+        board = Bitboard()
+        player = 'X'
+        for _ in range(BOARD_CELLS - rng.randint(min_empty, max_empty)):
+            (moves, _) = valid_moves(board)
+            if len(moves) == 0:
+                break
+            player = get_opponent(player)
+            board.play(rng.choice(moves), player)
+        if check_win(board) is not None:
+            continue
+        moves = best_moves(solver, board, player, time_limit)
+        if moves is not None and 2 * len(moves) <= len(valid_moves(board)[0]):
+            positions.append((board, player, moves))
+    return positions
+
+
+def accuracy(positions: List[Tuple[Bitboard, str, Set[int]]], policy: str, seed: int, playouts: int = sys.maxsize,
+             cpu_time: float = float('inf')) -> Tuple[float, float, float]:
+    """
+    Search each position in a new tree, for [playouts] playouts or [cpu_time] CPU seconds, whichever comes first
+
+    :return: (share of the positions where a best move is played, CPU seconds per move, playouts per move)
+    """
+    tree = SearchTree()
+    right = 0
+    done = 0
+    start = time.process_time()
+    for (board, player, moves) in positions:
+        random.seed(seed)
+        tree.clear()
+        tree.set_root(board, player)
+        done += iterate(tree, time.process_time() + cpu_time, max_playouts=playouts, policy=policy,
+                        clock=time.process_time)
+        move = best_move(tree)
+        if move in moves:
+            right += 1
+    seconds = time.process_time() - start
+    return (right / len(positions), seconds / len(positions), done / len(positions))
+
+
+def rollouts_per_second(positions: List[Tuple[Bitboard, str, Set[int]]], policy: str, seed: int,
+                        repeat: int) -> float:
+    rollout = ROLLOUT_POLICIES[policy]
+    random.seed(seed)
+    start = time.process_time()
+    for _ in range(repeat):
+        for (board, player, _) in positions:
+            rollout(board.copy(), player)
+    return repeat * len(positions) / (time.process_time() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark of the rollout policies of the MCTS agents.")
+    parser.add_argument('--policies', type=str, nargs='+', default=list(ROLLOUT_POLICIES),
+                        choices=list(ROLLOUT_POLICIES), help="policies to compare")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the positions and of the searches")
+    parser.add_argument('--positions', type=int, default=100, help="number of positions")
+    parser.add_argument('--min-empty', type=int, default=16, help="fewest empty cells of the positions")
+    parser.add_argument('--max-empty', type=int, default=24, help="most empty cells of the positions")
+    parser.add_argument('--solver-time', type=float, default=2.0,
+                        help="time limit of the solver for each move, positions it can't solve are skipped")
+    parser.add_argument('--playouts', type=int, nargs='+', default=list(DEFAULT_PLAYOUTS),
+                        help="numbers of playouts per move to compare the policies at")
+    parser.add_argument('--cpu-times', type=float, nargs='+', default=list(DEFAULT_CPU_TIMES),
+                        help="CPU times per move, in seconds, to compare the policies at")
+    parser.add_argument('--out', type=str, help="file to write the results to, as JSON (default: standard output)")
+    args = parser.parse_args(sys.argv[1:])
+    if not 0 < args.min_empty <= args.max_empty < BOARD_CELLS:
+        parser.error("the numbers of empty cells must be such that 0 < --min-empty <= --max-empty < {}".format(
+            BOARD_CELLS))
+
+    positions = solved_positions(args.positions, args.min_empty, args.max_empty, args.solver_time,
+                                 random.Random(args.seed))
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'parameters': {'seed': args.seed, 'positions': args.positions, 'min_empty': args.min_empty,
+                       'max_empty': args.max_empty},
+        # Rollouts per CPU second from the positions
+        'rollouts': {},
+        # Policy -> playouts -> accuracy and CPU seconds per move
+        'fixed_playouts': {},
+        # Policy -> CPU time -> accuracy and playouts per move
+        'fixed_time': {},
+    }
+    for policy in args.policies:
+        results['rollouts'][policy] = rollouts_per_second(positions, policy, args.seed, 20)
+        results['fixed_playouts'][policy] = {}
+        for playouts in args.playouts:
+            (right, seconds, _) = accuracy(positions, policy, args.seed, playouts=playouts)
+            results['fixed_playouts'][policy][playouts] = {'accuracy': right, 'cpu_seconds': seconds}
+        results['fixed_time'][policy] = {}
+        for cpu_time in args.cpu_times:
+            (right, _, done) = accuracy(positions, policy, args.seed, cpu_time=cpu_time)
+            results['fixed_time'][policy][cpu_time] = {'accuracy': right, 'playouts': done}
+    output = json.dumps(results, indent=2)
+    if args.out is not None:
+        with open(args.out, 'w') as file:
+            file.write(output + '\n')
+    else:
+        print(output)
+    # Summary: accuracy of each policy at each CPU time
+    print("{:>10} {:>10} ".format("policy", "rollouts/s")
+          + " ".join("{:>12}".format("{}s".format(cpu_time)) for cpu_time in args.cpu_times), file=sys.stderr)
+    for policy in args.policies:
+        print("{:>10} {:>10.0f} ".format(policy, results['rollouts'][policy])
+              + " ".join("{:>11.1f}%".format(100 * results['fixed_time'][policy][cpu_time]['accuracy'])
+                         for cpu_time in args.cpu_times), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,194 @@
+"""
+asyncio counterpart of GenericGameClient, so that many games can be played at once from a single process.
+
+aiohttp is only needed for this client, install it with `pip install aiohttp`.
+"""
+import asyncio
+
+import time
+
+from .recording import GameRecorder
+from .wrapper import BASE_URL, DEFAULT_POOL_SIZE, DEFAULT_TIMEOUT, MAX_POLL_BACKOFF, MIN_POLL_BACKOFF, MIN_POLL_TIME, \
+    ClientLibInternalException, ClientLibRequestException, GenericGameMove, GenericGameState
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+def _require_aiohttp():
+    if aiohttp is None:
+        raise ImportError("aiohttp is needed for the asyncio client, install it with `pip install aiohttp`")
+
+
+def make_async_session(pool_size: int = DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT):
+    """
+    Create a session keeping its connections to the server alive, to be shared by all the clients of an event loop.
+    It must be created and closed in the event loop, e.g. with `async with make_async_session() as session:`.
+
+    :param pool_size: number of connections kept open. Each game waiting for an update holds a connection, so it should
+                      be at least the number of games played at once.
+    :param timeout: default timeout of the requests in seconds, either a number or a (connect, read) tuple
+    :return: an aiohttp.ClientSession
+    """
+    _require_aiohttp()
+    return aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=pool_size), timeout=_client_timeout(timeout))
+
+
+def _client_timeout(timeout):
+    if isinstance(timeout, tuple):
+        (connect, read) = timeout
+        return aiohttp.ClientTimeout(connect=connect, sock_read=read)
+    return aiohttp.ClientTimeout(total=timeout)
+
+
+class AsyncGameClient:
+    """ Same as GenericGameClient, but its requests are coroutines """
+
+    def __init__(self, game_type, game_id=None, username=None, session=None, timeout=DEFAULT_TIMEOUT,
+                 recorder: GameRecorder = None):
+        """
+        :param session: session to send the requests with, see make_async_session. If None, the client creates its
+                        own, which is closed by close() or at the end of an async with statement. The client must
+                        then be created in the event loop.
+        :param timeout: timeout of the requests in seconds, either a number or a (connect, read) tuple
+        :param recorder: if given, records the states received and the moves submitted
+        """
+        _require_aiohttp()
+        self.game_type = game_type
+        self.username = username
+        self.game_id = game_id
+        self.game_state = None
+        self.session_id = ""
+        self.clock = 0
+        self.timeout = _client_timeout(timeout)
+        # Current delay before polling again, see MIN_POLL_TIME
+        self.poll_backoff = 0
+        # Only the session created by the client is closed by it, a shared one belongs to whoever created it
+        self._owns_session = session is None
+        self.session = session if session is not None else make_async_session()
+        self.recorder = recorder
+
+    async def close(self):
+        if self._owns_session:
+            await self.session.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+    @staticmethod
+    async def create_game(game_type, session, timeout=DEFAULT_TIMEOUT) -> str:
+        """
+        :param session: session to send the request with, see make_async_session
+        :return: the id of the new game
+        """
+        async with session.post("{}/api/create-game".format(BASE_URL), json={"game_type": game_type},
+                                timeout=_client_timeout(timeout)) as res:
+            if not res.ok:
+                raise ClientLibRequestException(res.reason, res.status)
+            res_json = await res.json()
+        if res_json['game_id'] != "":
+            return res_json['game_id']
+        else:
+            raise ClientLibRequestException("No Game Id Returned")
+
+    async def join_game(self, game_id: str = None, username: str = None):
+        if username is not None:
+            self.username = username
+        if game_id is not None:
+            self.game_id = game_id
+        async with self.session.post("{}/api/{}/join-game".format(BASE_URL, self.game_id),
+                                     json={"username": self.username}, timeout=self.timeout) as res:
+            if not res.ok:
+                raise ClientLibRequestException(res.reason, res.status)
+            res_json = await res.json()
+        if res_json['session_id'] != "":
+            self.session_id = res_json['session_id']
+        else:
+            raise ClientLibRequestException("No Session Id Returned")
+
+    async def get_state(self) -> dict:
+        """ get state and return it as a dictionary """
+        if self.game_id is None:
+            raise ClientLibInternalException("No Game Id provided, you need to call create game or construct a client "
+                                             "with a game id")
+        async with self.session.get("{}/api/{}/get-state".format(BASE_URL, self.game_id),
+                                    timeout=self.timeout) as res:
+            if not res.ok:
+                raise ClientLibRequestException(res.reason, res.status)
+            return await res.json()
+
+    async def update_state(self, current_state: GenericGameState) -> ():
+        """ get state and update the state object """
+        self._apply_state(current_state, await self.get_state())
+
+    def _apply_state(self, current_state: GenericGameState, encoded_game_state: dict):
+        if self.recorder is not None:
+            self.recorder.record_state(encoded_game_state)
+        current_state.update_game_state(encoded_game_state)
+
+    async def submit_move(self, move: GenericGameMove):
+        if self.game_id is None:
+            raise ClientLibInternalException("No Game Id provided, you need to call create game or construct a client "
+                                             "with a game id")
+        if self.session_id is None:
+            raise ClientLibInternalException("No Session Id provided. Please call join_game to join a game first.")
+        async with self.session.post("{}/api/{}/submit-move".format(BASE_URL, self.game_id),
+                                     json={"session_id": self.session_id, "payload": move.encode_game_move()},
+                                     timeout=self.timeout) as res:
+            if not res.ok:
+                raise ClientLibRequestException(res.reason, res.status)
+            res_json = await res.json()
+        if not res_json["success"]:
+            raise ClientLibRequestException("Update failed")
+        if self.recorder is not None:
+            self.recorder.record_move(move.encode_game_move())
+
+    async def _poll_update(self) -> dict:
+        async with self.session.get("{}/api/{}/wait-for-update".format(BASE_URL, self.game_id),
+                                    params={"since": self.clock}, timeout=self.timeout) as res:
+            if not res.ok:
+                raise ClientLibRequestException(res.reason, res.status)
+            return await res.json()
+
+    async def _back_off(self):
+        self.poll_backoff = min(MAX_POLL_BACKOFF, max(MIN_POLL_BACKOFF, 2 * self.poll_backoff))
+        await asyncio.sleep(self.poll_backoff)
+
+    async def wait_for_update(self) -> bool:
+        """ Waits for server to respond.
+        Returns true when SOME update has happened, false if timeout (5 seconds)"""
+        try:
+            res_json = await self._poll_update()
+        except asyncio.TimeoutError:
+            return False
+        clk = int(res_json["clock"])
+        if clk > self.clock:
+            self.clock = clk
+            return True
+        return False
+
+    async def wait_for_state(self, current_state: GenericGameState) -> bool:
+        """ Same as GenericGameClient.wait_for_state """
+        start = time.monotonic()
+        try:
+            res_json = await self._poll_update()
+        except asyncio.TimeoutError:
+            await self._back_off()
+            return False
+        clk = int(res_json["clock"])
+        if clk <= self.clock:
+            if time.monotonic() - start < MIN_POLL_TIME:
+                await self._back_off()
+            return False
+        self.clock = clk
+        self.poll_backoff = 0
+        if "payload" in res_json:
+            self._apply_state(current_state, res_json)
+        else:
+            await self.update_state(current_state)
+        return True
@@ -0,0 +1,206 @@
+"""
+Instrumentation of a bot: time spent in each phase of a turn (search, board conversion, HTTP requests, waiting...)
+and counters (playouts, tree size, retries...), sent to pluggable sinks at the end of each turn.
+
+An Instrumentation without sinks records nothing anywhere, so that the hooks can always be called.
+"""
+import cProfile
+import csv
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional
+
+
+class TurnRecord:
+    """ What happened during a turn: from the end of the previous one to the end of our move """
+
+    def __init__(self, move: int):
+        self.move = move
+        self.timestamp = time.time()
+        # phase -> total seconds, and number of times it was entered
+        self.phases = {}
+        self.calls = {}
+        # name -> value, summed over the turn
+        self.counters = {}
+        # name -> last value
+        self.gauges = {}
+
+    def values(self) -> Dict[str, float]:
+        """ All the values of the record, with flat names such as 'phase.search' or 'counter.playouts' """
+        values = {}
+        values.update(('phase.' + name, seconds) for (name, seconds) in self.phases.items())
+        values.update(('calls.' + name, calls) for (name, calls) in self.calls.items())
+        values.update(('counter.' + name, value) for (name, value) in self.counters.items())
+        values.update(('gauge.' + name, value) for (name, value) in self.gauges.items())
+        return values
+
+
+class Sink:
+    """ Receives the record of every turn """
+
+    def emit(self, record: TurnRecord):
+        pass
+
+    def close(self):
+        pass
+
+
+class LogSink(Sink):
+    """ One log line per turn """
+
+    def __init__(self, logger: Optional[logging.Logger] = None, level: int = logging.INFO):
+        self.logger = logger if logger is not None else logging.getLogger('kilo_bots.instrumentation')
+        self.level = level
+
+    def emit(self, record: TurnRecord):
+        self.logger.log(self.level, "move %d: %s", record.move, " ".join(
+            "{}={:.4g}".format(name, value) for (name, value) in sorted(record.values().items())))
+
+
+class CSVSink(Sink):
+    """ One row per value of each turn: timestamp, move, name, value. The file is appended to. """
+
+    def __init__(self, path: str):
+        new_file = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._file = open(path, 'a', newline='')
+        self._writer = csv.writer(self._file)
+        if new_file:
+            self._writer.writerow(['timestamp', 'move', 'name', 'value'])
+
+    def emit(self, record: TurnRecord):
+        for (name, value) in sorted(record.values().items()):
+            self._writer.writerow([record.timestamp, record.move, name, value])
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class PrometheusTextfileSink(Sink):
+    """
+    Metrics in the text format read by the textfile collector of the Prometheus node exporter: the totals of the
+    phases and counters since the start, and the last value of the gauges. The file is rewritten atomically after
+    every turn.
+    """
+
+    def __init__(self, path: str, prefix: str = 'kilo_bots'):
+        self.path = path
+        self.prefix = prefix
+        self._phase_seconds = {}
+        self._phase_calls = {}
+        self._counters = {}
+        self._gauges = {}
+        self._turns = 0
+
+    def emit(self, record: TurnRecord):
+        self._turns += 1
+        for (name, seconds) in record.phases.items():
+            self._phase_seconds[name] = self._phase_seconds.get(name, 0) + seconds
+        for (name, calls) in record.calls.items():
+            self._phase_calls[name] = self._phase_calls.get(name, 0) + calls
+        for (name, value) in record.counters.items():
+            self._counters[name] = self._counters.get(name, 0) + value
+        self._gauges.update(record.gauges)
+        lines = ["# TYPE {}_turns_total counter".format(self.prefix),
+                 "{}_turns_total {}".format(self.prefix, self._turns)]
+        for (metric, kind, label, values) in (('phase_seconds_total', 'counter', 'phase', self._phase_seconds),
+                                              ('phase_calls_total', 'counter', 'phase', self._phase_calls),
+                                              ('counter_total', 'counter', 'name', self._counters),
+                                              ('gauge', 'gauge', 'name', self._gauges)):
+            lines.append("# TYPE {}_{} {}".format(self.prefix, metric, kind))
+            lines += ['{}_{}{{{}="{}"}} {}'.format(self.prefix, metric, label, name, value)
+                      for (name, value) in sorted(values.items())]
+        temporary_path = self.path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            file.write("\n".join(lines) + "\n")
+        os.replace(temporary_path, self.path)
+
+
+class Instrumentation:
+    """
+    Hooks called by the client, the agents and the game loop. The values recorded since the last call to end_turn
+    make up the record of the turn.
+    """
+
+    def __init__(self, sinks: Iterable[Sink] = (), profile_moves: Iterable[int] = (),
+                 profile_path: str = 'move_{}.prof'):
+        """
+        :param sinks: where the record of each turn is sent
+        :param profile_moves: numbers of our moves (from 1) to capture a cProfile of
+        :param profile_path: file the profile of a move is written to, formatted with the number of the move
+        """
+        self.sinks = list(sinks)
+        self.profile_moves = set(profile_moves)
+        self.profile_path = profile_path
+        self.moves = 0
+        self._record = TurnRecord(1)
+        # The hooks may be called from several threads, e.g. by a pondering agent
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return len(self.sinks) > 0
+
+    def add_time(self, phase: str, seconds: float):
+        with self._lock:
+            self._record.phases[phase] = self._record.phases.get(phase, 0) + seconds
+            self._record.calls[phase] = self._record.calls.get(phase, 0) + 1
+
+    @contextmanager
+    def timer(self, phase: str):
+        """ Time the body of a with statement as [phase] """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(phase, time.perf_counter() - start)
+
+    def count(self, name: str, value: float = 1):
+        with self._lock:
+            self._record.counters[name] = self._record.counters.get(name, 0) + value
+
+    def gauge(self, name: str, value: float):
+        with self._lock:
+            self._record.gauges[name] = value
+
+    @contextmanager
+    def move(self):
+        """ Wrap our move in a with statement: it is timed as the 'move' phase, and profiled if it was chosen to """
+        self.moves += 1
+        profile = cProfile.Profile() if self.moves in self.profile_moves else None
+        if profile is not None:
+            profile.enable()
+        try:
+            with self.timer('move'):
+                yield
+        finally:
+            if profile is not None:
+                profile.disable()
+                profile.dump_stats(self.profile_path.format(self.moves))
+
+    def end_turn(self):
+        """ Send the record of the turn to the sinks, and start the next one """
+        with self._lock:
+            (record, self._record) = (self._record, TurnRecord(self.moves + 1))
+        for sink in self.sinks:
+            sink.emit(record)
+
+    def close(self):
+        for sink in self.sinks:
+            sink.close()
+
+
+def make_instrumentation(log: bool = False, csv_path: Optional[str] = None, prometheus_path: Optional[str] = None,
+                         profile_moves: List[int] = (), profile_path: str = 'move_{}.prof') -> Instrumentation:
+    """ Instrumentation with the sinks asked for, e.g. by command line arguments """
+    sinks = []
+    if log:
+        sinks.append(LogSink())
+    if csv_path is not None:
+        sinks.append(CSVSink(csv_path))
+    if prometheus_path is not None:
+        sinks.append(PrometheusTextfileSink(prometheus_path))
+    return Instrumentation(sinks, profile_moves, profile_path)
@@ -0,0 +1,105 @@
+"""
+Recordings of games: one JSON object per line, appended and flushed as the game goes, so that a recording is usable
+even if the bot is stopped in the middle of a game.
+
+The first line is the header of the game:
+    {"event": "header", "version": 1, "game_type": ..., "game_id": ..., "username": ..., "time": ...}
+followed by, in the order they happened:
+    {"event": "state", "time": ..., "state": <the state as sent by the server>}
+    {"event": "move", "time": ..., "move": <the move as sent to the server>}
+"""
+import json
+import time
+from typing import Iterator, List, Optional, Tuple
+
+RECORDING_VERSION = 1
+
+
+class GameRecorder:
+    """ Records the states a client receives and the moves it submits """
+
+    def __init__(self, path: str, game_type: str, game_id: str, username: str):
+        """
+        :param path: file the recording is appended to
+        """
+        self._file = open(path, 'a')
+        # Encoded form of the last state recorded, the same state is only recorded once
+        self._last_state = None
+        self._write({"event": "header", "version": RECORDING_VERSION, "game_type": game_type, "game_id": game_id,
+                     "username": username, "time": time.time()})
+
+    def _write(self, event: dict):
+        self._file.write(json.dumps(event, separators=(',', ':')) + '\n')
+        self._file.flush()
+
+    def record_state(self, encoded_game_state: dict):
+        encoded = json.dumps(encoded_game_state, separators=(',', ':'), sort_keys=True)
+        if encoded == self._last_state:
+            return
+        self._last_state = encoded
+        self._write({"event": "state", "time": time.time(), "state": encoded_game_state})
+
+    def record_move(self, encoded_game_move):
+        self._write({"event": "move", "time": time.time(), "move": encoded_game_move})
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Recording:
+    """ A recorded game, loaded in memory """
+
+    def __init__(self, header: dict, events: List[dict]):
+        self.header = header
+        self.events = events
+
+    @property
+    def game_type(self) -> str:
+        return self.header['game_type']
+
+    @property
+    def username(self) -> str:
+        return self.header['username']
+
+    def states(self) -> Iterator[Tuple[dict, Optional[object]]]:
+        """
+        :return: each recorded state, with the move submitted from it, or None if no move was submitted before the
+                 next state
+        """
+        state = None
+        for event in self.events:
+            if event['event'] == 'state':
+                if state is not None:
+                    yield (state, None)
+                state = event['state']
+            elif event['event'] == 'move' and state is not None:
+                yield (state, event['move'])
+                state = None
+        if state is not None:
+            yield (state, None)
+
+
+def read_recording(path: str) -> Recording:
+    """ Load a recording. A last line cut short, e.g. because the bot was killed while writing it, is ignored. """
+    with open(path) as file:
+        lines = file.read().split('\n')
+    events = []
+    for (number, line) in enumerate(lines):
+        if line == '':
+            continue
+        try:
+            events.append(json.loads(line))
+        except json.JSONDecodeError:
+            if number < len(lines) - 1:
+                raise
+    if len(events) == 0 or events[0]['event'] != 'header':
+        raise ValueError("{} is not a game recording".format(path))
+    if events[0]['version'] > RECORDING_VERSION:
+        raise ValueError("{} is a recording of a newer version".format(path))
+    return Recording(events[0], events[1:])
@@ -1,9 +1,39 @@
 import requests
 import os
+import time
+from dataclasses import dataclass
+from typing import Callable, List
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from clientlib.instrumentation import Instrumentation
+from clientlib.recording import GameRecorder
 
 BASE_URL = os.environ[
     'GAME_SERVER_BASE_URL'] if 'GAME_SERVER_BASE_URL' in os.environ else "https://team-kilo-server.herokuapp.com"
 
+# Number of keep-alive connections kept open to the server by a session. All the requests of a client go to the same
+# host, so this is the number of requests that can be in flight at once without opening a new connection.
+DEFAULT_POOL_SIZE = 10
+
+# (connect, read) timeouts of every request, in seconds. The server answers wait-for-update after at most 5 seconds,
+# so the read timeout has to be longer than that.
+DEFAULT_TIMEOUT = (3.05, 10)
+
+# Number of times a request is retried when the connection fails or the server is unavailable, and the backoff
+# factor of the delay between two retries: backoff_factor * 2 ** (retry number - 1) seconds
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.1
+
+# Status codes for which the server is assumed to be temporarily unavailable
+RETRY_STATUSES = (502, 503, 504)
+
+# The server holds wait-for-update for up to 5 seconds. If it answers faster than this without an update, or the
+# request times out, the client waits before polling again, twice as long each time up to MAX_POLL_BACKOFF seconds.
+MIN_POLL_TIME = 0.5
+MIN_POLL_BACKOFF = 0.05
+MAX_POLL_BACKOFF = 2.0
+
 
 class ClientLibBaseException(Exception):
     pass
@@ -20,6 +50,27 @@ class ClientLibInternalException(ClientLibBaseException):
         super(ClientLibInternalException, self).__init__(message)
 
 
+class StateChange:
+    """ Base class of the changes found between two successive states of a game, see GenericGameState.subscribe """
+    pass
+
+
+@dataclass(frozen=True)
+class PlayerJoined(StateChange):
+    username: str
+
+
+@dataclass(frozen=True)
+class StageChanged(StateChange):
+    old: str
+    new: str
+
+
+@dataclass(frozen=True)
+class CanMoveChanged(StateChange):
+    can_move: List[str]
+
+
 class GenericGameState:
     def __init__(self):
         """
@@ -30,6 +81,7 @@ class GenericGameState:
         self.can_move = []
         self.winners = []
         self.game_state = {}
+        self._subscribers = []
 
     def __str__(self):
         return '''
@@ -42,9 +94,31 @@ game-specific state:
 {}
 '''.format(self.stage, self.players, self.can_move, self.winners, self.game_state)
 
+    def subscribe(self, callback: Callable[['GenericGameState', List[StateChange]], None]):
+        """
+        Call callback(state, changes) after every update of the state that changed something, with the list of the
+        changes found by diff_game_state, so that the subscriber can update what it derives from the state instead
+        of rebuilding it.
+        """
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback: Callable[['GenericGameState', List[StateChange]], None]):
+        self._subscribers.remove(callback)
+
     def update_game_state(self, encoded_game_state: dict):
         """
-        Update the game state stored in the object given a dict
+        Update the game state stored in the object given a dict, and notify the subscribers of the changes
+        :return: ()
+        """
+        changes = self.diff_game_state(encoded_game_state)
+        self.apply_game_state(encoded_game_state)
+        if len(changes) > 0:
+            for callback in self._subscribers:
+                callback(self, changes)
+
+    def apply_game_state(self, encoded_game_state: dict):
+        """
+        Store the new state. Subclasses keeping more than the dict should extend this.
         :return: ()
         """
         self.players = encoded_game_state['players']
@@ -53,6 +127,18 @@ game-specific state:
         self.winners = encoded_game_state['winners']
         self.game_state = encoded_game_state['payload']
 
+    def diff_game_state(self, encoded_game_state: dict) -> List[StateChange]:
+        """
+        Changes between the stored state and the new one, before it is applied. Subclasses should extend this with
+        the changes of their payload.
+        """
+        changes = [PlayerJoined(username) for username in encoded_game_state['players'][len(self.players):]]
+        if encoded_game_state['stage'] != self.stage:
+            changes.append(StageChanged(self.stage, encoded_game_state['stage']))
+        if encoded_game_state['can_move'] != self.can_move:
+            changes.append(CanMoveChanged(encoded_game_state['can_move']))
+        return changes
+
     def is_waiting_for_start(self) -> bool:
         return self.stage == "waiting"
 
@@ -79,19 +165,91 @@ class GenericGameMove:
         pass
 
 
+def make_session(pool_size: int = DEFAULT_POOL_SIZE, retries: int = DEFAULT_RETRIES,
+                 backoff_factor: float = DEFAULT_BACKOFF_FACTOR) -> requests.Session:
+    """
+    Create a session keeping its connections to the server alive, which can be shared by several clients.
+    It should be closed once it isn't used anymore, e.g. by using it in a with statement.
+
+    :param pool_size: number of connections kept open
+    :param retries: number of times a request is retried on a connection error or a status in RETRY_STATUSES
+    :param backoff_factor: the delay before the n-th retry is backoff_factor * 2 ** (n - 1) seconds
+    :return: the session
+    """
+    # Read errors aren't retried: the request may have reached the server, and a timeout of wait-for-update is
+    # handled by the client. POST requests are never retried once sent either, since moves must not be submitted twice.
+    retry = Retry(total=retries, read=False, status_forcelist=RETRY_STATUSES, backoff_factor=backoff_factor,
+                  raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
 class GenericGameClient:
-    def __init__(self, game_type, game_id=None, username=None):
+    def __init__(self, game_type, game_id=None, username=None, session: requests.Session = None,
+                 timeout=DEFAULT_TIMEOUT, instrumentation: Instrumentation = None, recorder: GameRecorder = None):
+        """
+        :param session: session to send the requests with, see make_session. If None, the client creates its own,
+                        which is closed by close() or at the end of a with statement.
+        :param timeout: timeout of the requests in seconds, either a number or a (connect, read) tuple
+        :param instrumentation: records the latency of the requests, as the phases http_<endpoint>, and the number of
+                                retries of the session, as the counter http_retries
+        :param recorder: if given, records the states received and the moves submitted
+        """
         self.game_type = game_type
         self.username = username
         self.game_id = game_id
         self.game_state = None
         self.session_id = ""
         self.clock = 0
+        self.timeout = timeout
+        # Current delay before polling again, see MIN_POLL_TIME
+        self.poll_backoff = 0
+        # Only the session created by the client is closed by it, a shared one belongs to whoever created it
+        self._owns_session = session is None
+        self.session = session if session is not None else make_session()
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        self.recorder = recorder
+
+    def close(self):
+        if self._owns_session:
+            self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _send(self, method: str, endpoint: str, **kwargs) -> requests.Response:
+        """
+        Send a request to an endpoint of the current game, timed by the instrumentation
+
+        :param method: 'get' or 'post'
+        """
+        start = time.perf_counter()
+        try:
+            res = getattr(self.session, method)("{}/api/{}/{}".format(BASE_URL, self.game_id, endpoint),
+                                                timeout=self.timeout, **kwargs)
+        finally:
+            self.instrumentation.add_time('http_' + endpoint.replace('-', '_'), time.perf_counter() - start)
+        # The Retry of the connection pool records the retries it made, other transports have none
+        retries = getattr(getattr(res, 'raw', None), 'retries', None)
+        if retries is not None and len(retries.history) > 0:
+            self.instrumentation.count('http_retries', len(retries.history))
+        return res
 
     # Create game
     @staticmethod
-    def create_game(game_type):
-        res = requests.post("{}/api/create-game".format(BASE_URL), json={"game_type": game_type})
+    def create_game(game_type, session: requests.Session = None, timeout=DEFAULT_TIMEOUT):
+        """
+        :param session: session to send the request with, if None a new connection is used
+        :return: the id of the new game
+        """
+        sender = session if session is not None else requests
+        res = sender.post("{}/api/create-game".format(BASE_URL), json={"game_type": game_type}, timeout=timeout)
         if res.ok:
             res_json = res.json()
             if res_json['game_id'] != "":
@@ -106,8 +264,7 @@ class GenericGameClient:
             self.username = username
         if game_id is not None:
             self.game_id = game_id
-        res = requests.post("{}/api/{}/join-game".format(BASE_URL, self.game_id),
-                            json={"username": self.username})
+        res = self._send('post', 'join-game', json={"username": self.username})
         if res.ok:
             res_json = res.json()
             if res_json['session_id'] != "":
@@ -122,7 +279,7 @@ class GenericGameClient:
         if self.game_id is None:
             raise ClientLibInternalException("No Game Id provided, you need to call create game or construct a client "
                                              "with a game id")
-        res = requests.get("{}/api/{}/get-state".format(BASE_URL, self.game_id))
+        res = self._send('get', 'get-state')
         if res.ok:
             res_json = res.json()
             return res_json
@@ -131,7 +288,12 @@ class GenericGameClient:
 
     def update_state(self, current_state: GenericGameState) -> ():
         """ get state and update the state object """
-        current_state.update_game_state(self.get_state())
+        self._apply_state(current_state, self.get_state())
+
+    def _apply_state(self, current_state: GenericGameState, encoded_game_state: dict):
+        if self.recorder is not None:
+            self.recorder.record_state(encoded_game_state)
+        current_state.update_game_state(encoded_game_state)
 
     def submit_move(self, move: GenericGameMove):
         if self.game_id is None:
@@ -139,32 +301,68 @@ class GenericGameClient:
                                              "with a game id")
         if self.session_id is None:
             raise ClientLibInternalException("No Session Id provided. Please call join_game to join a game first.")
-        res = requests.post("{}/api/{}/submit-move".format(BASE_URL, self.game_id),
-                            json={"session_id": self.session_id, "payload": move.encode_game_move()})
+        res = self._send('post', 'submit-move',
+                         json={"session_id": self.session_id, "payload": move.encode_game_move()})
         if res.ok:
             res_json = res.json()
             if not res_json["success"]:
                 raise ClientLibRequestException("Update failed")
             else:
+                if self.recorder is not None:
+                    self.recorder.record_move(move.encode_game_move())
                 return
         else:
             raise ClientLibRequestException(res.reason, res.status_code)
 
+    def _poll_update(self) -> dict:
+        res = self._send('get', 'wait-for-update', params={"since": self.clock})
+        if res.ok:
+            return res.json()
+        else:
+            raise ClientLibRequestException(res.reason, res.status_code)
+
+    def _back_off(self):
+        self.poll_backoff = min(MAX_POLL_BACKOFF, max(MIN_POLL_BACKOFF, 2 * self.poll_backoff))
+        time.sleep(self.poll_backoff)
+
     def wait_for_update(self) -> bool:
         """ Blocks and waits for server to respond.
         Returns true when SOME update has happened, false if timeout (5 seconds)"""
         try:
-            res = requests.get("{}/api/{}/wait-for-update".format(BASE_URL, self.game_id), params={"since": self.clock})
+            res_json = self._poll_update()
         except requests.exceptions.Timeout as e:
             return False
-        if res is not None:
-            if res.ok:
-                res_json = res.json()
-                clk = int(res_json["clock"])
-                if clk > self.clock:
-                    self.clock = clk
-                    return True
-                return False
-            else:
-                raise ClientLibRequestException(res.reason, res.status_code)
+        clk = int(res_json["clock"])
+        if clk > self.clock:
+            self.clock = clk
+            return True
         return False
+
+    def wait_for_state(self, current_state: GenericGameState) -> bool:
+        """
+        Blocks until the game is updated, and updates the state object. Same as wait_for_update followed by
+        update_state, except that:
+        - the state is only requested when the clock has moved
+        - if the server sends the state along with the clock, it is used directly, saving a round trip
+        - the client backs off when the request times out or the server answers straight away without an update
+
+        :return: True if the state has been updated, False if there was no update before the timeout
+        """
+        start = time.monotonic()
+        try:
+            res_json = self._poll_update()
+        except requests.exceptions.Timeout:
+            self._back_off()
+            return False
+        clk = int(res_json["clock"])
+        if clk <= self.clock:
+            if time.monotonic() - start < MIN_POLL_TIME:
+                self._back_off()
+            return False
+        self.clock = clk
+        self.poll_backoff = 0
+        if "payload" in res_json:
+            self._apply_state(current_state, res_json)
+        else:
+            self.update_state(current_state)
+        return True
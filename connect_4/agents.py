@@ -1,11 +1,36 @@
-from .mcts import mcts
-from .utils import Connect4State, Connect4Move
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+from clientlib.instrumentation import Instrumentation
+
+from .bitboard import Bitboard, BOARD_CELLS
+from .mcts import get_opponent, ponder, search, ROLLOUT_POLICIES
+from .opening_book import OpeningBook
+from .parallel import PARALLEL_MODES, leaf_parallel_search, root_parallel_search
+from .solver import WIN, Solver
+from .time_manager import TimeManager
+from .tree import SearchTree
+from .utils import BoardReset, Connect4State, Connect4Move, DiscAdded
 import random
 
 
 class Connect4BaseAgent:
     def get_next_move(self, state: Connect4State) -> Connect4Move: pass
 
+    def ponder(self, state: Connect4State):
+        """ Called with the state after our move, while waiting for the opponent's one """
+        pass
+
+    def stop_pondering(self):
+        """ Called when the opponent has played, or the game has ended """
+        pass
+
+    def close(self):
+        """ Called once the agent won't be used anymore, to free what it holds, e.g. processes """
+        pass
+
 
 class Connect4InteractiveAgent(Connect4BaseAgent):
     def get_next_move(self, state: Connect4State) -> Connect4Move:
@@ -29,10 +54,187 @@ class Connect4RandomAgent(Connect4BaseAgent):
 
 
 class Connect4MCTSAgent(Connect4BaseAgent):
-    def __init__(self, username: str, timelimit: float, probabilistic: bool):
+    # Number of empty cells from which the solver is tried before searching, see endgame_cells
+    DEFAULT_ENDGAME_CELLS = 20
+    # Share of the time of a move the solver can use, the search gets what is left
+    SOLVER_SHARE = 0.5
+
+    def __init__(self, username: str, timelimit: float, probabilistic: bool, workers: int = 1,
+                 parallel: str = 'root', batch_size: int = 1, ponder: bool = False,
+                 time_manager: Optional[TimeManager] = None, book: Optional[OpeningBook] = None,
+                 instrumentation: Optional[Instrumentation] = None, endgame_cells: int = DEFAULT_ENDGAME_CELLS,
+                 rollout_policy: str = 'random'):
+        """
+        :param workers: number of processes to search with. If more than 1, the search is parallelised according
+                        to [parallel]: 'root' to search independent trees and merge their root statistics, or 'leaf' to
+                        search a single tree and do batches of rollouts in the worker processes.
+        :param batch_size: number of rollouts done at once from each leaf with NumPy, when searching in this process.
+        :param ponder: keep searching in a background thread while the opponent thinks. Not done with root
+                       parallelism, since there is no tree kept in this process.
+        :param time_manager: if given, the time of each move is given by it instead of [timelimit], and the search
+                             stops as soon as the best move can't change anymore.
+        :param book: if given, positions that are in it are played from it without searching. The agent owns it, and
+                     closes it in close().
+        :param instrumentation: records the time of the phases 'board' and 'search', the counters playouts,
+                                iterations and book_moves, and the gauges tree_size and max_depth of each move.
+                                With root parallelism, only the time is recorded.
+        :param endgame_cells: once there are at most this many empty cells, the position is first given to the exact
+                              solver, and its move is played if it proves a win. 0 to never use it.
+        :param rollout_policy: how the moves of the rollouts are chosen, one of mcts.ROLLOUT_POLICIES. Only 'random'
+                               can be done in batches, so other policies need a batch_size of 1.
+        """
+        if parallel not in PARALLEL_MODES:
+            raise ValueError("parallel must be one of {}".format(PARALLEL_MODES))
+        if rollout_policy not in ROLLOUT_POLICIES:
+            raise ValueError("rollout_policy must be one of {}".format(tuple(ROLLOUT_POLICIES)))
+        if rollout_policy != 'random' and batch_size > 1:
+            raise ValueError("batches of rollouts are always random, rollout_policy needs a batch_size of 1")
         self._username = username
         self._timelimit = timelimit
         self._probabilistic = probabilistic
+        self._workers = workers
+        self._parallel = parallel
+        self._batch_size = batch_size
+        self._rollout_policy = rollout_policy
+        # Created on the first move, so that agents that are never used don't start processes
+        self._executor = None
+        # Search tree, kept from one move to the next so that the statistics of the positions that are still
+        # reachable are reused. The ones that aren't are recycled as the tree fills up.
+        self._tree = None
+        # State the agent is playing in, and its board, kept up to date by _on_state_changes
+        self._state = None
+        self._board = None
+        self._ponder = ponder
+        self._time_manager = time_manager
+        self._book = book
+        self._endgame_cells = endgame_cells
+        # Created the first time it is used, its transposition table is kept from one move to the next
+        self._solver = None
+        self._instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+        # Thread searching while the opponent thinks, and the event to stop it
+        self._ponder_thread = None
+        self._stop_pondering = threading.Event()
 
     def get_next_move(self, state: Connect4State) -> Connect4Move:
-        return Connect4Move(mcts(state.to_O_X(), state.symbol_player_map[self._username], self._timelimit, self._probabilistic))
+        if self._time_manager is None:
+            return Connect4Move(self._search(state, self._timelimit))
+        self._time_manager.start_move()
+        try:
+            moves_played = self._get_board(state).moves
+            return Connect4Move(self._search(state, self._time_manager.time_for_move(moves_played)))
+        finally:
+            self._time_manager.end_move()
+
+    def _search(self, state: Connect4State, time_limit: float) -> int:
+        turn = state.symbol_player_map[self._username]
+        board = self._get_board(state)
+        if self._book is not None:
+            move = self._book.lookup(board, get_opponent(turn))
+            if move is not None:
+                self._instrumentation.count('book_moves')
+                return move
+        if 0 < BOARD_CELLS - board.moves <= self._endgame_cells:
+            start = time.monotonic()
+            if self._solver is None:
+                self._solver = Solver()
+            with self._instrumentation.timer('solver'):
+                (value, move, exact) = self._solver.solve(board, turn, self.SOLVER_SHARE * time_limit)
+            self._instrumentation.count('solver_nodes', self._solver.nodes)
+            # Drawn and lost positions are left to the search, which plays the moves the opponent is the most likely
+            # to go wrong after
+            if exact and value == WIN:
+                print("--SOLVER-- win proven, {} nodes".format(self._solver.nodes))
+                self._instrumentation.count('solved_moves')
+                return move
+            time_limit = max(0.0, time_limit - (time.monotonic() - start))
+        if self._workers > 1 and self._parallel == 'root':
+            # Each worker builds its own tree, so there is nothing to reuse
+            with self._instrumentation.timer('search'):
+                return root_parallel_search(board, turn, time_limit, self._probabilistic, self._get_executor(),
+                                            self._workers, self._rollout_policy)
+        self.stop_pondering()
+        # The statistics of the position are kept if the tree already has it, e.g. from the previous search
+        tree = self._get_tree()
+        tree.set_root(board, get_opponent(turn))
+        visits = tree.visits[tree.root]
+        with self._instrumentation.timer('search'):
+            if self._workers > 1:
+                move = leaf_parallel_search(tree, time_limit, self._probabilistic, self._get_executor(),
+                                            self._workers, policy=self._rollout_policy)
+            else:
+                move = search(tree, time_limit, self._probabilistic, self._batch_size,
+                              early_stop=self._time_manager is not None, policy=self._rollout_policy)
+        playouts = tree.visits[tree.root] - visits
+        self._instrumentation.count('playouts', playouts)
+        if self._workers == 1:
+            # Each iteration does a batch of rollouts from its leaf
+            self._instrumentation.count('iterations', playouts // self._batch_size)
+        self._instrumentation.gauge('tree_size', len(tree))
+        self._instrumentation.gauge('max_depth', tree.max_depth)
+        return move
+
+    def ponder(self, state: Connect4State):
+        if not self._ponder or (self._workers > 1 and self._parallel == 'root'):
+            return
+        if not state.is_in_progress() or state.player_can_move(self._username):
+            return
+        self.stop_pondering()
+        # Search from the position after our move: when the opponent plays, the subtree of their move is kept
+        # by re-rooting the tree in get_next_move
+        self._get_tree().set_root(self._get_board(state), state.symbol_player_map[self._username])
+        self._stop_pondering.clear()
+        self._ponder_thread = threading.Thread(target=ponder, daemon=True,
+                                               args=(self._tree, self._stop_pondering, self._probabilistic,
+                                                     self._batch_size, self._rollout_policy))
+        self._ponder_thread.start()
+
+    def stop_pondering(self):
+        if self._ponder_thread is not None:
+            self._stop_pondering.set()
+            self._ponder_thread.join()
+            self._ponder_thread = None
+
+    def close(self):
+        self.stop_pondering()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._book is not None:
+            self._book.close()
+            self._book = None
+
+    def _get_tree(self) -> SearchTree:
+        if self._tree is None:
+            self._tree = SearchTree()
+        return self._tree
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self._workers)
+        return self._executor
+
+    def _get_board(self, state: Connect4State) -> Bitboard:
+        """
+        Board of state. It is only built from the cells the first time the agent sees the state object, and then
+        updated with the discs added to it.
+        """
+        if state is not self._state:
+            if self._state is not None:
+                self._state.unsubscribe(self._on_state_changes)
+            state.subscribe(self._on_state_changes)
+            self._state = state
+            self._board = None
+        if self._board is None:
+            with self._instrumentation.timer('board'):
+                self._board = Bitboard.from_O_X(state.to_O_X())
+        return self._board
+
+    def _on_state_changes(self, state: Connect4State, changes):
+        if self._board is None:
+            return
+        for change in changes:
+            if isinstance(change, DiscAdded):
+                self._board.play(change.column, state.symbol_player_map[change.player])
+            elif isinstance(change, BoardReset):
+                self._board = None
+                return
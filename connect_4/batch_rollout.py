@@ -0,0 +1,82 @@
+"""
+Batched rollouts: play many random games from the same leaf at once, with NumPy arrays of bitboards.
+
+NumPy is only needed for this backend, which is used when Connect4MCTSAgent is given a batch size bigger than 1.
+"""
+from typing import Dict
+
+from .bitboard import Bitboard, BOARD_CELLS, BOARD_HEIGHT, BOARD_WIDTH, COLUMN_BITS, DIRECTIONS, PLAYER_INDEX, \
+    PLAYERS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+_rng = None
+
+
+def _get_rng():
+    global _rng
+    if np is None:
+        raise ImportError("NumPy is needed for batched rollouts, install it with `pip install numpy`")
+    if _rng is None:
+        _rng = np.random.default_rng()
+    return _rng
+
+
+def has_four(bits):
+    """
+    Checks whether each board contains four aligned discs, by shifting and masking in each direction
+
+    :param bits: array of boards of a single player, with dtype uint64
+    :return: array of bools, True where there is a line of four
+    """
+    result = np.zeros(bits.shape, dtype=bool)
+    for shift in DIRECTIONS:
+        shift = np.uint64(shift)
+        pairs = bits & (bits >> shift)
+        result |= (pairs & (pairs >> (shift + shift))) != 0
+    return result
+
+
+def rollout_batch(state: Bitboard, last_player: str, playouts: int, rng=None) -> Dict[str, int]:
+    """
+    Play [playouts] random games from state at once. The games still going on are kept in arrays of bitboards,
+    and each ply is played in all of them with vectorized legal move masks and win detection.
+
+    :param state: the state of the leaf to rollout
+    :param last_player: 'O' or 'X': who has just played to get to state
+    :param playouts: number of games to play
+    :param rng: numpy random Generator to use, if None a generator shared by the module is used
+    :return: number of games won by 'O', won by 'X', and drawn ('draw'), to be passed to backpropagate_results
+    """
+    rng = rng if rng is not None else _get_rng()
+    results = {'O': 0, 'X': 0, 'draw': 0}
+    if state.winner is not None:
+        results[state.winner] = playouts
+        return results
+    # One row per game still going on
+    boards = np.array([state.boards] * playouts, dtype=np.uint64)
+    heights = np.array([state.heights] * playouts, dtype=np.int64)
+    player_index = 1 - PLAYER_INDEX[last_player]
+    for _ in range(BOARD_CELLS - state.moves):
+        # Uniformly random legal column in each game: the legal column with the biggest random score
+        scores = rng.random((len(heights), BOARD_WIDTH))
+        scores[heights >= BOARD_HEIGHT] = -1
+        columns = scores.argmax(axis=1)
+        games = np.arange(len(heights))
+        positions = (columns * COLUMN_BITS + heights[games, columns]).astype(np.uint64)
+        boards[:, player_index] |= np.left_shift(np.uint64(1), positions)
+        heights[games, columns] += 1
+        won = has_four(boards[:, player_index])
+        wins = int(won.sum())
+        if wins > 0:
+            results[PLAYERS[player_index]] += wins
+            boards = boards[~won]
+            heights = heights[~won]
+            if len(heights) == 0:
+                return results
+        player_index = 1 - player_index
+    results['draw'] += len(heights)
+    return results
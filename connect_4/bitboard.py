@@ -0,0 +1,170 @@
+from typing import List, Optional
+
+from .utils import Connect4State
+
+BOARD_WIDTH = Connect4State.GAME_BOARD_WIDTH
+BOARD_HEIGHT = Connect4State.GAME_BOARD_HEIGHT
+
+# Each column takes BOARD_HEIGHT bits plus one empty sentinel bit on top, so that shifting a line of discs
+# never wraps around from the top of one column to the bottom of the next.
+COLUMN_BITS = BOARD_HEIGHT + 1
+
+# Shifts corresponding to the 4 directions a line can go in: vertical, horizontal, and the two diagonals
+DIRECTIONS = (1, COLUMN_BITS, COLUMN_BITS - 1, COLUMN_BITS + 1)
+
+# Index of each player's board in Bitboard.boards
+PLAYER_INDEX = {'O': 0, 'X': 1}
+PLAYERS = ('O', 'X')
+
+# Number of moves after which the board is full
+BOARD_CELLS = BOARD_WIDTH * BOARD_HEIGHT
+
+# Mask with every playable cell of the first column set
+COLUMN_MASK = (1 << BOARD_HEIGHT) - 1
+
+# Mask with every playable cell set
+FULL_MASK = sum(COLUMN_MASK << (col * COLUMN_BITS) for col in range(BOARD_WIDTH))
+
+
+def cell_bit(col: int, row: int) -> int:
+    """
+    Bit corresponding to a cell of the board
+
+    :param col: column, from 0 to BOARD_WIDTH-1
+    :param row: row, from 0 (bottom) to BOARD_HEIGHT-1
+    :return: an int with only the bit of that cell set
+    """
+    return 1 << (col * COLUMN_BITS + row)
+
+
+def _win_lines() -> List[int]:
+    lines = []
+    for col in range(BOARD_WIDTH):
+        for row in range(BOARD_HEIGHT):
+            for (d_col, d_row) in ((1, 0), (0, 1), (1, 1), (1, -1)):
+                cells = [(col + i * d_col, row + i * d_row) for i in range(4)]
+                if all(0 <= c < BOARD_WIDTH and 0 <= r < BOARD_HEIGHT for (c, r) in cells):
+                    lines.append(sum(cell_bit(c, r) for (c, r) in cells))
+    return lines
+
+
+# Mask of each of the 69 possible lines of four on the board
+WIN_LINES = _win_lines()
+
+# For each bit position (col * COLUMN_BITS + row), the masks of the lines of four going through that cell.
+# Sentinel positions have no lines.
+LINES_THROUGH_CELL = [tuple(line for line in WIN_LINES if line & (1 << position))
+                      for position in range(BOARD_WIDTH * COLUMN_BITS)]
+
+
+def completes_line(bits: int, position: int) -> bool:
+    """
+    Checks whether the disc at [position] is part of a line of four, only looking at the lines through that cell.
+    This is enough to tell whether the last move won the game, as long as the game was not over before.
+
+    :param bits: the board of the player who owns the disc
+    :param position: bit position of the disc, i.e. col * COLUMN_BITS + row
+    :return: True if there is a line of four through that disc
+    """
+    for line in LINES_THROUGH_CELL[position]:
+        if bits & line == line:
+            return True
+    return False
+
+
+class Bitboard:
+    """
+    Connect 4 board stored as one int per player, where each set bit is a disc of that player,
+    plus the height of each column so that a move is O(1).
+    The number of moves and the result of the game are kept up to date by play, so checking whether the game has
+    ended is also O(1).
+    """
+    __slots__ = ('boards', 'heights', 'moves', 'winner')
+
+    def __init__(self, boards: Optional[List[int]] = None, heights: Optional[List[int]] = None,
+                 moves: int = 0, winner: Optional[str] = None):
+        # [discs of 'O', discs of 'X']
+        self.boards = boards if boards is not None else [0, 0]
+        self.heights = heights if heights is not None else [0] * BOARD_WIDTH
+        # Number of discs on the board
+        self.moves = moves
+        # 'O', 'X', 'draw', or None if the game is not over
+        self.winner = winner
+
+    def copy(self) -> 'Bitboard':
+        return Bitboard(self.boards[:], self.heights[:], self.moves, self.winner)
+
+    def can_play(self, col: int) -> bool:
+        return self.heights[col] < BOARD_HEIGHT
+
+    def play(self, col: int, player: str):
+        """
+        Drop a disc of [player] in column [col] and update the result of the game, only looking at the lines through
+        the new disc. The caller is responsible for checking that the column is not full.
+        """
+        position = col * COLUMN_BITS + self.heights[col]
+        index = PLAYER_INDEX[player]
+        self.boards[index] |= 1 << position
+        self.heights[col] += 1
+        self.moves += 1
+        if completes_line(self.boards[index], position):
+            self.winner = player
+        elif self.moves == BOARD_CELLS and self.winner is None:
+            self.winner = 'draw'
+
+    def mask(self) -> int:
+        """ All the discs on the board """
+        return self.boards[0] | self.boards[1]
+
+    def key(self) -> int:
+        """
+        Unique key of the position: adding the mask to the board of 'O' sets the bit just above the top disc of
+        each column, which tells where 'O' discs end and 'X' discs start.
+        """
+        return self.boards[0] + self.mask()
+
+    def mirror(self) -> 'Bitboard':
+        """ The same position with the columns in reverse order """
+        boards = [0, 0]
+        for index in range(2):
+            for col in range(BOARD_WIDTH):
+                column = (self.boards[index] >> (col * COLUMN_BITS)) & COLUMN_MASK
+                boards[index] |= column << ((BOARD_WIDTH - 1 - col) * COLUMN_BITS)
+        return Bitboard(boards, self.heights[::-1], self.moves, self.winner)
+
+    def get(self, col: int, row: int) -> Optional[str]:
+        """ 'O', 'X' or None if the cell is empty """
+        bit = cell_bit(col, row)
+        if self.boards[0] & bit:
+            return 'O'
+        if self.boards[1] & bit:
+            return 'X'
+        return None
+
+    def to_O_X(self) -> List[List[str]]:
+        """ Convert back to the list of columns format given by Connect4State.to_O_X """
+        return [[self.get(col, row) for row in range(self.heights[col])] for col in range(BOARD_WIDTH)]
+
+    @staticmethod
+    def from_O_X(state: List[List[str]]) -> 'Bitboard':
+        """
+        Build a bitboard from the format given by Connect4State.to_O_X. Every line of four on the board is completed by
+        one of the discs as they are replayed, so the result of the game is known as well.
+
+        :param state: list of columns, each one a list of 'O' and 'X' from the bottom up
+        :return: the corresponding bitboard
+        """
+        board = Bitboard()
+        for col, column in enumerate(state):
+            for player in column:
+                board.play(col, player)
+        return board
+
+    def __eq__(self, other):
+        return isinstance(other, Bitboard) and self.boards == other.boards
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return 'Bitboard({})'.format(self.to_O_X())
@@ -1,10 +1,14 @@
 import math
 import sys
+import threading
 import time
-from typing import List, Tuple, Optional
+from typing import Dict, List, Tuple, Optional
 
+from .batch_rollout import rollout_batch
+from .bitboard import Bitboard, completes_line, BOARD_CELLS, COLUMN_BITS, PLAYER_INDEX, PLAYERS
+from .rollout_policies import rollout_center, rollout_lines, rollout_win_block
+from .tree import SearchTree, NO_NODE, PROVEN_LOSS, PROVEN_WIN, node_key
 from .utils import Connect4State
-from copy import deepcopy
 
 import random
 
@@ -13,51 +17,39 @@ BOARD_HEIGHT = Connect4State.GAME_BOARD_HEIGHT
 
 DEBUG = False
 
+# How often pondering checks whether it has to stop, in seconds
+PONDER_SLICE = 0.01
 
-class Node:
-    def __init__(self, parent: Optional['Node'],
-                 state: List[List[str]], children: List['Node'],
-                 last_player: str, last_move: Optional[int] = None):
-        self.parent = parent
-        self.state = state
-        # Child states that have been selected once at least
-        self.children = children
-        # will be 'O' or 'X': WHO HAD JUST PLAYED to get to this state. Corresponds to the colour of the node.
-        self.last_player = last_player
-        self.last_move = last_move
-        # (Number of Wins for [last_player=colour of node], Number of Play-outs from this node)
-        self.visits = 0
-        self.wins = 0
+# Number of iterations between two reads of the clock during the search
+CHECK_EVERY = 16
 
 
-# Assume that the game state is represented as a list of lists, each one corresponding to a column.
+# The game state is represented as a Bitboard, see bitboard.py. Use Bitboard.from_O_X and Bitboard.to_O_X to
+# convert from/to the list of columns format given by Connect4State.to_O_X.
+# The search tree is a SearchTree, see tree.py, where nodes are indices and don't store their board.
 
 
-def step(state: List[List[str]], turn: str, move: int, copy=False):
+def step(state: Bitboard, turn: str, move: int, copy=False):
     """
     Step the state
 
-    :param copy: perform deep copy if set to true, otherwise just step it
-    :param turn 1 or -1
+    :param copy: copy the board if set to true, otherwise just step it
+    :param turn 'O' or 'X'
     :param state
     :param move
-    :return reference to the NEXT STATE 2D-list, or None if the move is invalid.
+    :return reference to the NEXT STATE Bitboard, or None if the move is invalid.
     """
-    if len(state[move]) >= BOARD_HEIGHT:
+    if state.heights[move] >= BOARD_HEIGHT:
         return None
 
     if copy:
-        # Deep copy if it is asked
-        n_state = deepcopy(state)
-        n_state[move].append(turn)
-        return n_state
-    else:
-        # Otherwise just step and return
-        state[move].append(turn)
-        return state
+        # Copy if it is asked: this is only two ints and a list of heights
+        state = state.copy()
+    state.play(move, turn)
+    return state
 
 
-def valid_moves(state: List[List[str]]) -> Tuple[List[int], Optional[str]]:
+def valid_moves(state: Bitboard) -> Tuple[List[int], Optional[str]]:
     """
     Compute the valid moves for a given state
 
@@ -65,108 +57,22 @@ def valid_moves(state: List[List[str]]) -> Tuple[List[int], Optional[str]]:
     :return: (valid_move_list, None) if there are valid moves, or ([], winner) if the game ended where winner is 'O', 'X' or 'draw'.
     """
     # if game ended, then just return empty list
-    winner = check_win(state)
+    winner = state.winner
     if winner is not None: return ([], winner)
     # else game is continuing
-    valid_move_list = []
-    for move in range(len(state)):
-        if len(state[move]) < BOARD_HEIGHT:
-            valid_move_list.append(move)
-    return (valid_move_list, None)
+    heights = state.heights
+    return ([move for move in range(BOARD_WIDTH) if heights[move] < BOARD_HEIGHT], None)
 
 
-def check_win(state: List[List[str]]):
+def check_win(state: Bitboard):
     """
-    Checks whether the game has ended
-
-    TODO: Clean Up
+    Checks whether the game has ended. This is O(1): the bitboard keeps the result up to date on every move, only
+    looking at the lines through the disc that was just played and at the number of moves.
 
     :param state: game state
     :return: 'O' or 'X' if winner, 'draw' if draw and None if not ended yet
     """
-    # Draw
-    if all([len(col) == BOARD_HEIGHT for col in state]):
-        return 'draw'
-    # Who wins
-    # cols
-    current_p = 'O'
-    current_count = 0
-    for column in state:
-        for el in column:
-            if el == current_p:
-                current_count += 1
-                if current_count == 4:
-                    return current_p
-            else:
-                current_count = 1
-                current_p = el
-        current_count = 0
-        current_p = 'O'
-
-    # Rows
-    for row_num in range(BOARD_HEIGHT):
-        row = [col[row_num] if len(col) > row_num else None for col in state]
-        for el in row:
-            if el is None:
-                current_count = 0
-                continue
-            if el == current_p:
-                current_count += 1
-                if current_count == 4:
-                    return current_p
-            else:
-                current_count = 1
-                current_p = el
-        current_count = 0
-        current_p = 'O'
-
-    # Diagonal - top left to bottom right, x is first arg of list, y is second
-    max_x_offset = BOARD_WIDTH - 4  # value=3
-    for x_init_offset in range(max_x_offset + 1):
-        diagonal1 = [state[x_init_offset + i][i]
-                     if x_init_offset + i < BOARD_WIDTH and i < len(state[x_init_offset + i])
-                     else None
-                     for i in range(min(BOARD_WIDTH - x_init_offset, BOARD_HEIGHT))]
-        diagonal2 = [state[(BOARD_WIDTH - x_init_offset - 1) - i][i]
-                     if (BOARD_WIDTH - x_init_offset - 1) - i >= 0
-                        and i < len(state[(BOARD_WIDTH - x_init_offset - 1) - i]) else None
-                     for i in range(min(BOARD_WIDTH - x_init_offset, BOARD_HEIGHT))]
-        for diagonal in [diagonal1, diagonal2]:
-            for el in diagonal:
-                if el is None:
-                    current_count = 0
-                    continue
-                if el == current_p:
-                    current_count += 1
-                    if current_count == 4:
-                        return current_p
-                else:
-                    current_count = 1
-                    current_p = el
-            current_count = 0
-            current_p = 'O'
-    max_y_offset = BOARD_HEIGHT - 4
-    for y_init_offset in range(max_y_offset + 1):
-        diagonal1 = [state[i][y_init_offset + i] if y_init_offset + i < len(state[i]) else None for i in
-                     range((min(BOARD_HEIGHT - y_init_offset, BOARD_WIDTH)))]
-        diagonal2 = [state[i][(BOARD_HEIGHT - y_init_offset - 1) - i]
-                     if 0 <= (BOARD_HEIGHT - y_init_offset - 1) - i < len(state[i]) else None for i in
-                     range(min(BOARD_HEIGHT - y_init_offset, BOARD_WIDTH))]
-        for diagonal in [diagonal1, diagonal2]:
-            for el in diagonal:
-                if el is None:
-                    current_count = 0
-                    continue
-                if el == current_p:
-                    current_count += 1
-                    if current_count == 4:
-                        return current_p
-                else:
-                    current_count = 1
-                    current_p = el
-            current_count = 0
-            current_p = 'O'
-    return None
+    return state.winner
 
 
 def uct_value(parent_visit, node_visit, node_wins):
@@ -185,29 +91,45 @@ def uct_value(parent_visit, node_visit, node_wins):
     return node_wins / node_visit + math.sqrt(2 * math.log(parent_visit) / node_visit)
 
 
-def uct_children(node: Node):
+def uct_children(tree: SearchTree, node: int, children: List[int]):
     """
-    Computes the UCT Values for all the children of node
+    Computes the UCT Values for the children of node
 
+    :param tree: search tree
     :param node: current node
+    :param children: children of node
     :return:
     """
-    parent_visit = node.visits
-    children_uct_values = list(map(lambda n: uct_value(parent_visit, n.visits, n.wins), node.children))
-    return children_uct_values
-
-
-def uct_children_sample(node: Node, probabilistic=False) -> Node:
+    # Same as uct_value, inlined and with the log computed once since this is the hot path of selection.
+    # A child that is proven won is always chosen, and one that is proven lost never is, unless they all are.
+    visits = tree.visits
+    wins = tree.wins
+    proven = tree.proven
+    log_parent_visit = 2 * math.log(visits[node]) if visits[node] > 0 else 0
+    return [(wins[c] / visits[c] + math.sqrt(log_parent_visit / visits[c]) if visits[c] > 0 else sys.maxsize)
+            if not proven[c] else sys.maxsize if proven[c] == PROVEN_WIN else 0.0
+            for c in children]
+
+
+def uct_children_sample(tree: SearchTree, node: int, state: Bitboard, probabilistic=False) -> Tuple[int, int]:
     """
     Gets a random child node of the considered node, weighted with their UCT Values
 
     :param probabilistic: if True use probabilistic approach, else use deterministic one
-    :param node: node considered
-    :return: random child node weighted by the UCT value
+    :param tree: search tree
+    :param node: node considered, which has been expanded
+    :param state: board of node
+    :return: (move, child) random child node weighted by the UCT value, and the move leading to it. The child is
+             NO_NODE if one of the children has been recycled, in which case node needs to be expanded again.
     """
-    children_uct_values = uct_children(node)
-    return random.choices(node.children, children_uct_values)[0] if probabilistic else node.children[
-        max(range(len(children_uct_values)), key=lambda i: children_uct_values[i])]
+    moves = valid_moves(state)[0]
+    children = [tree.child(node, move) for move in moves]
+    if NO_NODE in children:
+        return (moves[children.index(NO_NODE)], NO_NODE)
+    children_uct_values = uct_children(tree, node, children)
+    i = random.choices(range(len(children)), children_uct_values)[0] if probabilistic else \
+        children_uct_values.index(max(children_uct_values))
+    return (moves[i], children[i])
 
 
 def get_opponent(player):
@@ -223,108 +145,353 @@ def get_opponent(player):
         return 'O'
 
 
-def select(node: Node, probabilistic: bool):
+def select(tree: SearchTree, probabilistic: bool) -> Tuple[List[int], Bitboard]:
     """
     Selection phase. From root node, go down the tree while selecting the best child according to
-    the UCT value or sampling (weighted by UCT value), and return ref to the leaf node when reached.
+    the UCT value or sampling (weighted by UCT value), and return the path to the leaf node when reached.
+    The board of each node is rebuilt along the way. Nodes whose result is proven are leaves as well.
 
     :param probabilistic: True if we want to go down the tree probabilistically, False if want deterministically
-    :param node: root node
-    :return: leaf node reached
+    :param tree: search tree, searched from its root
+    :return: (path, state) list of the nodes from the root to the leaf node reached, and the board of the leaf
     """
     if DEBUG:
         print("-- SELECT --")
-        print(node)
-    tmp = node
-    while len(tmp.children) > 0:
-        tmp = uct_children_sample(tmp, probabilistic)
+        print(tree.root_state)
+    state = tree.root_state.copy()
+    node = tree.root
+    path = [node]
+    expanded = tree.expanded
+    players = tree.players
+    referenced = tree.referenced
+    proven = tree.proven
+    while expanded[node] and not proven[node]:
+        (move, child) = uct_children_sample(tree, node, state, probabilistic)
+        if child == NO_NODE:
+            expanded[node] = 0
+            break
+        state.play(move, PLAYERS[players[child]])
+        node = child
+        path.append(node)
+        referenced[node] = 1
     # Now reach leaf node
-    return tmp
+    return (path, state)
 
 
-def expand(node: Node):
+def expand(tree: SearchTree, path: List[int], state: Bitboard) -> Optional[int]:
     """
-    Expand phase of MCTS: given a leaf node, expand it according to available moves, and return a randomly chosen one
+    Expand phase of MCTS: given a leaf node, expand it according to available moves, and return a randomly chosen one.
+    Children whose position is already in the tree are shared with the other nodes leading to it.
 
-    :param node: a leaf node of the search tree to be expanded
-    :return: None if it's a terminal node, or Some(Node) a random child constructed after the expansion
+    :param tree: search tree
+    :param path: nodes from the root to the leaf node to be expanded
+    :param state: board of the leaf node
+    :return: None if it's a terminal node, or Some(move) leading to a random child linked by the expansion
     """
-    assert len(node.children) == 0
+    node = path[-1]
+    assert not tree.expanded[node]
     if DEBUG:
         print("-- EXPAND --")
-        print(node)
-    (valid_move_list, _) = valid_moves(node.state)
+        print(state)
+    (valid_move_list, _) = valid_moves(state)
     if len(valid_move_list) == 0:
         return None
-    node.children += [Node(parent=node,
-                           state=step(state=node.state, turn=get_opponent(node.last_player), move=move, copy=True),
-                           children=[],
-                           last_player=get_opponent(node.last_player),
-                           last_move=move)
-                      for move in valid_move_list]
+    player_index = 1 - tree.players[node]
+    # Nodes that must not be recycled to make room for the children
+    keep = path[:]
+    for move in valid_move_list:
+        child = tree.child(node, move)
+        if child == NO_NODE:
+            child_state = step(state, PLAYERS[player_index], move, copy=True)
+            key = node_key(child_state, player_index)
+            child = tree.lookup(key)
+            if child == NO_NODE:
+                child = tree.add(key, player_index, keep)
+                if child_state.winner == PLAYERS[player_index]:
+                    tree.proven[child] = PROVEN_WIN
+            tree.link(node, move, child)
+        keep.append(child)
+    tree.expanded[node] = 1
     # Note: valid_moves returns the empty list if the game has ended.
-    return random.choice(node.children)
+    return random.choice(valid_move_list)
 
 
 def rollout_policy(possible_moves):
     """
-    Policy for doing the rollout. Uniform distribution right now, could be changed.
+    Policy for doing the rollout: uniform distribution. Other policies are in ROLLOUT_POLICIES.
 
     :param possible_moves: possible moves to be played from current state
     :return: a random choice of the possible moves
     """
-    return random.choice(possible_moves)
+    # Equivalent to random.choice, but cheaper since this is called on every ply of every rollout
+    return possible_moves[int(random.random() * len(possible_moves))]
 
 
-def rollout(node: Node):
+def rollout(state: Bitboard, last_player: str):
     """
     Rollout phase of MCTS: do random playout from leaf node until win/lose/draw reached.
 
-    :param node: the leaf node you want to rollout
+    :param state: the board of the leaf node you want to rollout. It is played on, so pass a copy if it's needed after.
+    :param last_player: 'O' or 'X': who has just played to get to state
     :return: the player who won
     """
-    state = deepcopy(node.state)
     if DEBUG:
         print("-- ROLLOUT --")
         print(state)
-    next_player = get_opponent(node.last_player)
-    (possible_moves, winner) = valid_moves(state)
-    while len(possible_moves) > 0:
-        state = step(state, next_player, rollout_policy(possible_moves), copy=False)
-        next_player = get_opponent(next_player)
-        (possible_moves, winner) = valid_moves(state)
-    return winner
-
-
-def backpropagate(node: Node, winner: str):
+    winner = check_win(state)
+    if winner is not None:
+        return winner
+    heights = state.heights
+    possible_moves = [move for move in range(BOARD_WIDTH) if heights[move] < BOARD_HEIGHT]
+    boards = state.boards
+    player_index = 1 - PLAYER_INDEX[last_player]
+    # The game was not over before, so only the lines through the last disc can be new lines of four,
+    # and the game is a draw once the remaining number of moves have been played.
+    for _ in range(BOARD_CELLS - state.moves):
+        move = rollout_policy(possible_moves)
+        # Same as state.play, inlined
+        position = move * COLUMN_BITS + heights[move]
+        boards[player_index] |= 1 << position
+        heights[move] += 1
+        if completes_line(boards[player_index], position):
+            return PLAYERS[player_index]
+        if heights[move] == BOARD_HEIGHT:
+            possible_moves.remove(move)
+        player_index = 1 - player_index
+    return 'draw'
+
+
+# Rollout functions by name, see rollout_policies.py. Batches of rollouts (batch_size bigger than 1) are always random.
+ROLLOUT_POLICIES = {
+    'random': rollout,
+    'win_block': rollout_win_block,
+    'center': rollout_center,
+    'lines': rollout_lines,
+}
+
+
+def backpropagate(tree: SearchTree, path: List[int], winner: str):
     """
-    When the playout is over, back-propagate result up the tree while updating the stats.
+    When the playout is over, back-propagate result up the path followed in the tree while updating the stats.
 
-    :param node: leaf node from which to backprop
+    :param tree: search tree
+    :param path: nodes from the root to the leaf node from which to backprop
     :param winner: the winner of the simulation
     :return: ()
     """
     if DEBUG:
         print("-- BACKPROP --")
-        print(node)
-    tmp_node = node
-    while tmp_node is not None:
-        tmp_node.visits += 1
-        if tmp_node.last_player == winner:
-            tmp_node.wins += 1
+        print(path)
+    visits = tree.visits
+    wins = tree.wins
+    players = tree.players
+    winner_index = PLAYER_INDEX.get(winner)
+    for node in path:
+        visits[node] += 1
+        if players[node] == winner_index:
+            wins[node] += 1
         elif winner == 'draw':
-            tmp_node.wins += 0.5
-        tmp_node = tmp_node.parent
+            wins[node] += 0.5
 
 
-def best_child(node: Node):
+def backpropagate_results(tree: SearchTree, path: List[int], results: Dict[str, int]):
     """
-    Best child of the (root) node
+    Back-propagate the results of several playouts from the same leaf at once.
 
-    :param node: root node
-    :return: best child of the node, i.e. the one with the most visits.
+    :param tree: search tree
+    :param path: nodes from the root to the leaf node from which to backprop
+    :param results: number of playouts won by 'O', won by 'X', and drawn ('draw')
+    :return: ()
     """
-    return max(node.children, key=lambda n: n.visits)
+    playouts = sum(results.values())
+    draws = results.get('draw', 0)
+    for node in path:
+        tree.visits[node] += playouts
+        tree.wins[node] += results.get(PLAYERS[tree.players[node]], 0) + 0.5 * draws
+
+
+def propagate_proof(tree: SearchTree, path: List[int]):
+    """
+    Once the last node of [path] is proven, prove the nodes above it whose result follows: a node is lost for the
+    player who has just played to get to it if the opponent has a winning move, and won if all the moves of the
+    opponent lose.
+
+    :param tree: search tree
+    :param path: nodes from the root to the proven node
+    """
+    proven = tree.proven
+    children = tree.children
+    for i in range(len(path) - 2, -1, -1):
+        node = path[i]
+        if proven[node]:
+            return
+        if proven[path[i + 1]] == PROVEN_WIN:
+            proven[node] = PROVEN_LOSS
+            continue
+        start = node * BOARD_WIDTH
+        for move in range(BOARD_WIDTH):
+            # Only the full columns aren't linked by the expansion
+            if children[start + move] == NO_NODE:
+                continue
+            child = tree.child(node, move)
+            if child == NO_NODE or proven[child] != PROVEN_LOSS:
+                return
+        proven[node] = PROVEN_WIN
+
+
+def proof_winner(tree: SearchTree, node: int) -> str:
+    """ :return: the winner of a proven node """
+    player_index = tree.players[node]
+    return PLAYERS[player_index if tree.proven[node] == PROVEN_WIN else 1 - player_index]
+
+
+def root_children(tree: SearchTree) -> List[Tuple[int, int]]:
+    """
+    Children of the root of the tree
+
+    :param tree: search tree
+    :return: list of (move, child), for the children that are in the tree
+    """
+    children = [(move, tree.child(tree.root, move)) for move in valid_moves(tree.root_state)[0]]
+    return [(move, child) for (move, child) in children if child != NO_NODE]
+
+
+def best_move(tree: SearchTree) -> Optional[int]:
+    """
+    Best move from the root of the tree
+
+    :param tree: search tree
+    :return: move leading to the best child of the root, i.e. a child proven won, or the one with the most visits
+             among the children that aren't proven lost, or None if it hasn't been expanded
+    """
+    children = root_children(tree)
+    if len(children) == 0:
+        return None
+    proven = tree.proven
+    for (move, child) in children:
+        if proven[child] == PROVEN_WIN:
+            return move
+    children = [(move, child) for (move, child) in children if proven[child] != PROVEN_LOSS] or children
+    return max(children, key=lambda c: tree.visits[c[1]])[0]
+
+
+def is_decided(tree: SearchTree, playouts_left: float) -> bool:
+    """
+    Whether the most visited child of the root can't be overtaken anymore, so the search can stop early
+
+    :param tree: search tree
+    :param playouts_left: number of playouts that can still be done in the time left
+    :return: True if the gap in visits between the two most visited children of the root is bigger than playouts_left
+    """
+    visits = sorted((tree.visits[child] for (_, child) in root_children(tree)), reverse=True)
+    if len(visits) == 0:
+        return False
+    if len(visits) == 1:
+        return True
+    return visits[0] - visits[1] > playouts_left
+
+
+def iterate(tree: SearchTree, max_time: float, probabilistic=False, batch_size=1, early_stop=False,
+            max_playouts=sys.maxsize, policy='random', clock=time.monotonic) -> int:
+    """
+    Run MCTS iterations (select, expand, rollout, backpropagate) from the root until [max_time], or until the result
+    of the root is proven
+
+    :param tree: search tree, searched from its root
+    :param max_time: time at which to stop, as given by clock(). The clock is only read every few iterations, see
+                     CHECK_EVERY.
+    :param probabilistic: whether to do this probabilistically or deterministically
+    :param batch_size: number of rollouts done from each leaf. If more than 1, they are done at once with
+                       the NumPy backend in batch_rollout.py, and back-propagated in one update.
+    :param early_stop: also stop as soon as the best move can't change anymore, see is_decided
+    :param max_playouts: also stop once this many playouts have been done, e.g. to benchmark a fixed amount of work
+    :param policy: name of the rollout policy, see ROLLOUT_POLICIES
+    :param clock: time.monotonic, or e.g. time.process_time to give the search a budget of CPU time
+    :return: the number of playouts done
+    """
+    rollout_function = ROLLOUT_POLICIES[policy]
+    playouts = 0
+    iterations = 0
+    # An iteration with a batch of rollouts is slower, so the clock needs to be read more often
+    check_every = max(1, CHECK_EVERY // batch_size)
+    proven = tree.proven
+    start = now = clock()
+    while now < max_time and playouts < max_playouts and not proven[tree.root]:
+        (path, state) = select(tree, probabilistic)
+        if proven[path[-1]]:
+            # No need for a rollout when the result is known
+            backpropagate(tree, path, proof_winner(tree, path[-1]))
+            playouts += 1
+        else:
+            move = expand(tree, path, state)
+            if move is not None:
+                child = tree.child(path[-1], move)
+                state.play(move, PLAYERS[tree.players[child]])
+                path.append(child)
+            if len(path) - 1 > tree.max_depth:
+                tree.max_depth = len(path) - 1
+            last_player = PLAYERS[tree.players[path[-1]]]
+            if batch_size > 1:
+                backpropagate_results(tree, path, rollout_batch(state, last_player, batch_size))
+                playouts += batch_size
+            else:
+                simulation_result = rollout_function(state, last_player)
+                backpropagate(tree, path, simulation_result)
+                playouts += 1
+        if proven[path[-1]]:
+            propagate_proof(tree, path)
+        iterations += 1
+        if iterations % check_every == 0:
+            now = clock()
+            if early_stop and now > start and is_decided(tree, playouts / (now - start) * (max_time - now)):
+                break
+    return playouts
+
+
+def ponder(tree: SearchTree, stop: threading.Event, probabilistic=False, batch_size=1, policy='random') -> int:
+    """
+    Run MCTS iterations from the root until [stop] is set, e.g. in a background thread while the opponent thinks
+
+    :param tree: search tree, searched from its root
+    :param stop: event telling when to stop
+    :param probabilistic: whether to do this probabilistically or deterministically
+    :param batch_size: number of rollouts done at once from each leaf, see iterate
+    :param policy: name of the rollout policy, see ROLLOUT_POLICIES
+    :return: the number of playouts done
+    """
+    playouts = 0
+    while not stop.is_set() and check_win(tree.root_state) is None:
+        if tree.proven[tree.root]:
+            # Nothing left to search, wait to be stopped
+            stop.wait()
+            break
+        playouts += iterate(tree, time.monotonic() + PONDER_SLICE, probabilistic, batch_size, policy=policy)
+    return playouts
+
+
+def search(tree: SearchTree, time_limit: float, probabilistic=False, batch_size=1, early_stop=False,
+           policy='random'):
+    """
+    Do MCTS from the root of the tree (e.g. with statistics kept from a previous search) with time limit [time_limit]
+
+    :param tree: search tree, whose root is the state to play from. Its statistics are kept and updated.
+    :param time_limit: in seconds, please be conservative because this isn't a strict limit
+    :param probabilistic: whether to do this probabilistically or deterministically
+    :param batch_size: number of rollouts done at once from each leaf, see iterate
+    :param early_stop: stop as soon as the best move can't change anymore, see is_decided
+    :param policy: name of the rollout policy, see ROLLOUT_POLICIES
+    :return: integer from 0 to BOARD_WIDTH-1 to indicate the move, or None if the game has ended
+    """
+    if check_win(tree.root_state) is not None:
+        return None
+    iterate(tree, time.monotonic() + time_limit, probabilistic, batch_size, early_stop, policy=policy)
+    print("--CHOICES--")
+    print([(move, tree.wins[child], tree.visits[child]) for (move, child) in root_children(tree)])
+    move = best_move(tree)
+    if move is None:
+        # Only if the root was proven before its children could be searched again
+        return valid_moves(tree.root_state)[0][0]
+    return move
 
 
 def mcts(state: List[List[str]], turn: str, time_limit: float, probabilistic=False):
@@ -333,26 +500,14 @@ def mcts(state: List[List[str]], turn: str, time_limit: float, probabilistic=Fal
     and [probabilistic?] probabilistically : deterministically
 
     :param probabilistic: whether to do this probabilistically or deterministically
-    :param state: state of board
+    :param state: state of board, in the format given by Connect4State.to_O_X
     :param turn: 'O' or 'X': indicates who's turn it is
     :param time_limit: in seconds, please be conservative because this isn't a strict limit
     :return: integer from 0 to BOARD_WIDTH-1 to indicate the move
     """
-    if check_win(state) is not None:
-        return None
-    opponent = get_opponent(turn)
-    root = Node(None, state, children=[], last_player=opponent, last_move=None)
-    max_time = time.time() + time_limit
-    while time.time() < max_time:
-        promising_node = select(root, probabilistic)
-        leaf = expand(promising_node)
-        if leaf is None:
-            leaf = promising_node
-        simulation_result = rollout(leaf)
-        backpropagate(leaf, simulation_result)
-    print("--CHOICES--")
-    print(list(map(lambda n: (n.last_move, n.wins, n.visits), root.children)))
-    return best_child(root).last_move
+    tree = SearchTree()
+    tree.set_root(Bitboard.from_O_X(state), get_opponent(turn))
+    return search(tree, time_limit, probabilistic)
 
 
 if __name__ == '__main__':
@@ -384,7 +539,7 @@ if __name__ == '__main__':
               ['X', 'O', 'O'],
               ['X', 'X', 'X', 'O'],
               ['O']]
-    print(check_win(state_))
+    print(check_win(Bitboard.from_O_X(state_)))
     print(mcts(state_, 'O', 1, False))
 
 # Note: inspired from
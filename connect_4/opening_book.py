@@ -0,0 +1,171 @@
+"""
+Opening book: the move to play in the first positions of a game, found offline with long searches.
+
+The book is a binary file with a header, the sorted keys of the positions, and the move for each of them, in the
+same order. It is memory-mapped and searched by bisection, so that loading it costs nothing and looking a position up
+doesn't allocate. Positions and their mirror images share an entry.
+
+To generate a book, run `python -m connect_4.opening_book --ply 4 --time 1 --out book.bin`.
+"""
+import argparse
+import bisect
+import mmap
+import struct
+import sys
+import time
+from array import array
+from typing import Dict, Iterable, Optional, Tuple
+
+from .bitboard import Bitboard, BOARD_WIDTH, PLAYER_INDEX, PLAYERS
+from .mcts import best_move, get_opponent, iterate, valid_moves
+from .tree import SearchTree, node_key
+
+MAGIC = b'C4BOOK\x00\x01'
+
+# Written in the byte order of the machine that generated the book, to detect a book copied to a machine with another
+# byte order, which would read the keys wrong
+BYTE_ORDER_MARK = 0x0102030405060708
+
+# Magic, number of positions, byte order mark
+_HEADER = struct.Struct('=8sQQ')
+
+
+def book_key(state: Bitboard, last_player: str) -> Tuple[int, bool]:
+    """
+    Key of a position in the book: the smallest of the keys of the position and of its mirror image
+
+    :param state: the board
+    :param last_player: 'O' or 'X': who has just played to get to state
+    :return: the key, and whether it is the key of the mirror image, in which case the move in the book has to be
+             mirrored too
+    """
+    player_index = PLAYER_INDEX[last_player]
+    key = node_key(state, player_index)
+    mirrored_key = node_key(state.mirror(), player_index)
+    if mirrored_key < key:
+        return (mirrored_key, True)
+    return (key, False)
+
+
+def write_book(path: str, entries: Dict[int, int]):
+    """
+    :param path: file to write the book to
+    :param entries: dict mapping the book key of each position to the move to play in it
+    """
+    keys = sorted(entries)
+    with open(path, 'wb') as file:
+        file.write(_HEADER.pack(MAGIC, len(keys), BYTE_ORDER_MARK))
+        array('Q', keys).tofile(file)
+        file.write(bytes(entries[key] for key in keys))
+
+
+class OpeningBook:
+    """ Book written by write_book, memory-mapped from [path] """
+
+    def __init__(self, path: str):
+        with open(path, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, count, byte_order_mark) = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError("{} is not an opening book".format(path))
+        if byte_order_mark != BYTE_ORDER_MARK:
+            self._mmap.close()
+            raise ValueError("{} was generated on a machine with another byte order".format(path))
+        # The header is 24 bytes long, so the keys are aligned
+        keys_end = _HEADER.size + 8 * count
+        self._view = memoryview(self._mmap)
+        self._keys = self._view[_HEADER.size:keys_end].cast('Q')
+        self._moves = self._view[keys_end:keys_end + count]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def lookup(self, state: Bitboard, last_player: str) -> Optional[int]:
+        """
+        :param state: the board
+        :param last_player: 'O' or 'X': who has just played to get to state
+        :return: the move to play from state, or None if the position isn't in the book
+        """
+        (key, mirrored) = book_key(state, last_player)
+        i = bisect.bisect_left(self._keys, key)
+        if i == len(self._keys) or self._keys[i] != key:
+            return None
+        move = self._moves[i]
+        return BOARD_WIDTH - 1 - move if mirrored else move
+
+    def close(self):
+        # The views have to be released before the map can be closed
+        self._keys.release()
+        self._moves.release()
+        self._view.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def book_positions(max_ply: int) -> Iterable[Tuple[Bitboard, str]]:
+    """
+    All the positions of the first [max_ply] moves of a game, whoever starts, once per book key
+
+    :return: (board, player who has just played) pairs
+    """
+    seen = set()
+    # Before the first move, the player who has "just played" is the one who doesn't start
+    layer = [(Bitboard(), player) for player in PLAYERS]
+    for _ in range(max_ply):
+        next_layer = []
+        for (state, last_player) in layer:
+            (key, _) = book_key(state, last_player)
+            if key in seen:
+                continue
+            seen.add(key)
+            yield (state, last_player)
+            (moves, winner) = valid_moves(state)
+            if winner is not None:
+                continue
+            turn = get_opponent(last_player)
+            for move in moves:
+                child = state.copy()
+                child.play(move, turn)
+                next_layer.append((child, turn))
+        layer = next_layer
+
+
+def generate_book(max_ply: int, time_limit: float, verbose: bool = False) -> Dict[int, int]:
+    """
+    Search every position of the first [max_ply] moves of a game for [time_limit] seconds
+
+    :return: dict mapping the book key of each position to the move found, to be passed to write_book
+    """
+    entries = {}
+    tree = SearchTree()
+    for (state, last_player) in book_positions(max_ply):
+        if state.winner is not None:
+            continue
+        tree.clear()
+        tree.set_root(state, last_player)
+        iterate(tree, time.monotonic() + time_limit)
+        move = best_move(tree)
+        (key, mirrored) = book_key(state, last_player)
+        entries[key] = BOARD_WIDTH - 1 - move if mirrored else move
+        if verbose:
+            print("{} positions, {} moves played: {}".format(len(entries), state.moves, move))
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate an opening book for Connect4MCTSAgent.")
+    parser.add_argument('--ply', type=int, default=4, help="number of moves of the game covered by the book")
+    parser.add_argument('--time', type=float, default=1.0, help="search time per position, in seconds")
+    parser.add_argument('--out', type=str, required=True, help="file to write the book to")
+    args = parser.parse_args(sys.argv[1:])
+    write_book(args.out, generate_book(args.ply, args.time, verbose=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+import random
+import time
+from concurrent.futures import Executor, wait
+from typing import Dict, List, Optional, Tuple
+
+from .bitboard import Bitboard, PLAYERS
+from .mcts import backpropagate, backpropagate_results, best_move, check_win, expand, get_opponent, iterate, \
+    proof_winner, propagate_proof, root_children, select, valid_moves, ROLLOUT_POLICIES
+from .tree import SearchTree
+
+# Ways of running MCTS on several cores, see Connect4MCTSAgent
+PARALLEL_MODES = ('root', 'leaf')
+
+# Time kept aside to send the results of the workers back, in seconds
+COLLECT_MARGIN = 0.01
+
+# Number of rollouts each worker does for a leaf in leaf parallelism. The results have to be sent back to the
+# main process for each batch, so it shouldn't be too small.
+DEFAULT_BATCH_SIZE = 32
+
+# Everything in this file that runs in a worker must be a top level function, so that it can be pickled.
+
+# Search tree of a worker process, allocated on its first search and cleared for the next ones
+_worker_tree = None
+
+
+def _root_search_worker(board: Bitboard, turn: str, max_time: float, probabilistic: bool, seed: int,
+                        policy: str) -> Dict[int, Tuple[float, int]]:
+    global _worker_tree
+    # Workers are forked from the same process, so they need a seed of their own to explore different trees
+    random.seed(seed)
+    if _worker_tree is None:
+        _worker_tree = SearchTree()
+    tree = _worker_tree
+    tree.clear()
+    tree.set_root(board, get_opponent(turn))
+    iterate(tree, max_time, probabilistic, policy=policy)
+    return {move: (tree.wins[child], tree.visits[child]) for (move, child) in root_children(tree)}
+
+
+def root_parallel_statistics(board: Bitboard, turn: str, time_limit: float, probabilistic: bool,
+                             executor: Executor, workers: int, policy: str = 'random') -> Dict[int, List[float]]:
+    """
+    Root parallelism: search independent trees from the same position in [workers] processes, and merge the
+    statistics of the children of their roots.
+
+    :param board: position to play from
+    :param turn: 'O' or 'X': indicates who's turn it is
+    :param time_limit: in seconds, wall-clock time the search has to end in
+    :param probabilistic: whether to do this probabilistically or deterministically
+    :param executor: pool of processes to run the searches in
+    :param workers: number of independent searches
+    :param policy: name of the rollout policy, see mcts.ROLLOUT_POLICIES
+    :return: dict mapping each move to [wins, visits] summed over the searches
+    """
+    # time.monotonic() is the same clock in all the processes of the host, so the deadline can be sent to the workers
+    max_time = time.monotonic() + time_limit - COLLECT_MARGIN
+    futures = [executor.submit(_root_search_worker, board, turn, max_time, probabilistic, random.getrandbits(64),
+                               policy)
+               for _ in range(workers)]
+    merged = {}
+    for future in futures:
+        for move, (wins, visits) in future.result().items():
+            stats = merged.setdefault(move, [0, 0])
+            stats[0] += wins
+            stats[1] += visits
+    return merged
+
+
+def root_parallel_search(board: Bitboard, turn: str, time_limit: float, probabilistic: bool,
+                         executor: Executor, workers: int, policy: str = 'random') -> Optional[int]:
+    """
+    Do root parallel MCTS on board for player [turn] with time limit [time_limit], see root_parallel_statistics
+
+    :param board: position to play from
+    :param turn: 'O' or 'X': indicates who's turn it is
+    :param time_limit: in seconds, please be conservative because this isn't a strict limit
+    :param probabilistic: whether to do this probabilistically or deterministically
+    :param executor: pool of processes to run the searches in
+    :param workers: number of independent searches
+    :param policy: name of the rollout policy, see mcts.ROLLOUT_POLICIES
+    :return: integer from 0 to BOARD_WIDTH-1 to indicate the move, or None if the game has ended
+    """
+    if check_win(board) is not None:
+        return None
+    stats = root_parallel_statistics(board, turn, time_limit, probabilistic, executor, workers, policy)
+    print("--CHOICES--")
+    print(sorted((move, wins, visits) for move, (wins, visits) in stats.items()))
+    if len(stats) == 0:
+        # The workers didn't have time to do anything
+        return valid_moves(board)[0][0]
+    return max(stats, key=lambda move: stats[move][1])
+
+
+def _rollout_worker(board: Bitboard, last_player: str, playouts: int, seed: int, policy: str) -> Dict[str, int]:
+    random.seed(seed)
+    rollout = ROLLOUT_POLICIES[policy]
+    results = {'O': 0, 'X': 0, 'draw': 0}
+    for _ in range(playouts):
+        results[rollout(board.copy(), last_player)] += 1
+    return results
+
+
+def leaf_parallel_search(tree: SearchTree, time_limit: float, probabilistic: bool, executor: Executor, workers: int,
+                         batch_size: int = DEFAULT_BATCH_SIZE, policy: str = 'random'):
+    """
+    Leaf parallelism: a single tree is searched in this process, and the rollouts from each leaf are done in batches
+    of [batch_size] by each of the [workers] processes.
+
+    :param tree: search tree, whose root is the state to play from. Its statistics are kept and updated.
+    :param time_limit: in seconds, wall-clock time the search has to end in
+    :param probabilistic: whether to do this probabilistically or deterministically
+    :param executor: pool of processes to run the rollouts in
+    :param workers: number of batches of rollouts sent for each leaf
+    :param batch_size: number of rollouts in each batch
+    :param policy: name of the rollout policy, see mcts.ROLLOUT_POLICIES
+    :return: integer from 0 to BOARD_WIDTH-1 to indicate the move, or None if the game has ended
+    """
+    if check_win(tree.root_state) is not None:
+        return None
+    max_time = time.monotonic() + time_limit - COLLECT_MARGIN
+    while time.monotonic() < max_time and not tree.proven[tree.root]:
+        (path, state) = select(tree, probabilistic)
+        if tree.proven[path[-1]]:
+            backpropagate(tree, path, proof_winner(tree, path[-1]))
+            propagate_proof(tree, path)
+            continue
+        move = expand(tree, path, state)
+        if move is not None:
+            child = tree.child(path[-1], move)
+            state.play(move, PLAYERS[tree.players[child]])
+            path.append(child)
+        if len(path) - 1 > tree.max_depth:
+            tree.max_depth = len(path) - 1
+        winner = check_win(state)
+        if winner is not None:
+            # No need to send terminal positions to the workers
+            backpropagate(tree, path, winner)
+            if tree.proven[path[-1]]:
+                propagate_proof(tree, path)
+            continue
+        last_player = PLAYERS[tree.players[path[-1]]]
+        futures = [executor.submit(_rollout_worker, state, last_player, batch_size, random.getrandbits(64), policy)
+                   for _ in range(workers)]
+        (done, not_done) = wait(futures, timeout=max(0.0, max_time - time.monotonic()) + COLLECT_MARGIN)
+        # Batches that haven't started yet would keep the workers busy into the next search. The running ones are
+        # short, since they are only batch_size rollouts.
+        for future in not_done:
+            future.cancel()
+        results = {'O': 0, 'X': 0, 'draw': 0}
+        for future in done:
+            for winner, count in future.result().items():
+                results[winner] += count
+        backpropagate_results(tree, path, results)
+    print("--CHOICES--")
+    print([(move, tree.wins[child], tree.visits[child]) for (move, child) in root_children(tree)])
+    move = best_move(tree)
+    if move is None:
+        return valid_moves(tree.root_state)[0][0]
+    return move
@@ -0,0 +1,112 @@
+import random
+
+from .bitboard import Bitboard, BOARD_CELLS, BOARD_HEIGHT, BOARD_WIDTH, COLUMN_BITS, FULL_MASK, LINES_THROUGH_CELL, \
+    PLAYER_INDEX, PLAYERS, completes_line
+from .solver import BOTTOM_MASK, winning_cells
+
+# Rollouts with a smarter choice of moves than mcts.rollout. They all take the board of a leaf, which they play on,
+# and the player who has just played to get to it, and return the winner ('O', 'X' or 'draw').
+
+# Chances of each column to be played by rollout_center, the middle column being 4 times as likely as the sides
+CENTER_TICKETS = tuple(col for col in range(BOARD_WIDTH)
+                       for _ in range(BOARD_WIDTH // 2 + 1 - abs(col - BOARD_WIDTH // 2)))
+
+
+def rollout_win_block(state: Bitboard, last_player: str) -> str:
+    """
+    Win if you can, block if you must: a player wins as soon as it has a winning move, plays where the opponent would
+    win otherwise, and plays randomly if there is neither
+    """
+    winner = state.winner
+    if winner is not None:
+        return winner
+    boards = state.boards
+    heights = state.heights
+    mask = boards[0] | boards[1]
+    possible_moves = [move for move in range(BOARD_WIDTH) if heights[move] < BOARD_HEIGHT]
+    # Cells completing a line of each player, empty or not: they only change when the player plays
+    threats = [winning_cells(boards[0], 0), winning_cells(boards[1], 0)]
+    player_index = 1 - PLAYER_INDEX[last_player]
+    for _ in range(BOARD_CELLS - state.moves):
+        possible = (mask + BOTTOM_MASK) & FULL_MASK
+        if threats[player_index] & possible:
+            return PLAYERS[player_index]
+        blocks = threats[1 - player_index] & possible
+        if blocks:
+            # Lowest of the cells to block: the others, if any, can't all be blocked anyway
+            bit = blocks & -blocks
+            move = (bit.bit_length() - 1) // COLUMN_BITS
+        else:
+            move = possible_moves[int(random.random() * len(possible_moves))]
+            bit = 1 << (move * COLUMN_BITS + heights[move])
+        # No move can complete a line here, since the winning moves have been looked for before
+        boards[player_index] |= bit
+        threats[player_index] = winning_cells(boards[player_index], 0)
+        mask |= bit
+        heights[move] += 1
+        if heights[move] == BOARD_HEIGHT:
+            possible_moves.remove(move)
+        player_index = 1 - player_index
+    return 'draw'
+
+
+def rollout_center(state: Bitboard, last_player: str) -> str:
+    """ Random moves, the central columns being more likely, see CENTER_TICKETS """
+    winner = state.winner
+    if winner is not None:
+        return winner
+    boards = state.boards
+    heights = state.heights
+    tickets = [move for move in CENTER_TICKETS if heights[move] < BOARD_HEIGHT]
+    player_index = 1 - PLAYER_INDEX[last_player]
+    for _ in range(BOARD_CELLS - state.moves):
+        move = tickets[int(random.random() * len(tickets))]
+        position = move * COLUMN_BITS + heights[move]
+        boards[player_index] |= 1 << position
+        heights[move] += 1
+        if completes_line(boards[player_index], position):
+            return PLAYERS[player_index]
+        if heights[move] == BOARD_HEIGHT:
+            tickets = [ticket for ticket in tickets if ticket != move]
+        player_index = 1 - player_index
+    return 'draw'
+
+
+def rollout_lines(state: Bitboard, last_player: str) -> str:
+    """
+    Random moves weighted by the lines of four through the cell they fill that the opponent hasn't blocked yet, from
+    the table of the lines through each cell
+    """
+    winner = state.winner
+    if winner is not None:
+        return winner
+    boards = state.boards
+    heights = state.heights
+    possible_moves = [move for move in range(BOARD_WIDTH) if heights[move] < BOARD_HEIGHT]
+    player_index = 1 - PLAYER_INDEX[last_player]
+    for _ in range(BOARD_CELLS - state.moves):
+        opponent = boards[1 - player_index]
+        weights = []
+        total = 0
+        for move in possible_moves:
+            weight = 1
+            for line in LINES_THROUGH_CELL[move * COLUMN_BITS + heights[move]]:
+                if not line & opponent:
+                    weight += 1
+            total += weight
+            weights.append(total)
+        # Same as random.choices with cumulative weights, inlined
+        pick = random.random() * total
+        i = 0
+        while weights[i] <= pick:
+            i += 1
+        move = possible_moves[i]
+        position = move * COLUMN_BITS + heights[move]
+        boards[player_index] |= 1 << position
+        heights[move] += 1
+        if completes_line(boards[player_index], position):
+            return PLAYERS[player_index]
+        if heights[move] == BOARD_HEIGHT:
+            possible_moves.remove(move)
+        player_index = 1 - player_index
+    return 'draw'
@@ -0,0 +1,261 @@
+import argparse
+import random
+import sys
+import time
+from typing import Optional, Tuple
+
+from .bitboard import Bitboard, BOARD_CELLS, BOARD_WIDTH, COLUMN_BITS, COLUMN_MASK, FULL_MASK, PLAYER_INDEX, PLAYERS
+
+# Results of a position for the player to move. A search that stops before the end of the game can only prove wins
+# and losses: positions it can't settle are given the value of a draw.
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+# Columns from the center out: central discs are part of more lines, so these moves are usually the best ones
+CENTER_ORDER = tuple(sorted(range(BOARD_WIDTH), key=lambda col: abs(2 * col - (BOARD_WIDTH - 1))))
+
+# Mask with the bottom cell of each column set
+BOTTOM_MASK = sum(1 << (col * COLUMN_BITS) for col in range(BOARD_WIDTH))
+
+# Mask of each column
+COLUMN_MASKS = tuple(COLUMN_MASK << (col * COLUMN_BITS) for col in range(BOARD_WIDTH))
+
+# Entries of the transposition table: exact value, or bound found by a cut-off
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# Number of nodes between two reads of the clock
+CHECK_EVERY = 1024
+
+# The transposition table is cleared when it gets bigger than this
+DEFAULT_TABLE_SIZE = 1 << 21
+
+
+class SolverTimeout(Exception):
+    pass
+
+
+def winning_cells(position: int, mask: int) -> int:
+    """
+    :param position: discs of a player
+    :param mask: all the discs on the board
+    :return: the empty cells, playable or not, where a disc of the player would complete a line of four
+    """
+    # Vertical: three discs below the cell
+    cells = (position << 1) & (position << 2) & (position << 3)
+    for shift in (COLUMN_BITS, COLUMN_BITS - 1, COLUMN_BITS + 1):
+        pair = (position << shift) & (position << (2 * shift))
+        cells |= pair & (position << (3 * shift))
+        cells |= pair & (position >> shift)
+        pair = (position >> shift) & (position >> (2 * shift))
+        cells |= pair & (position << shift)
+        cells |= pair & (position >> (3 * shift))
+    return cells & (FULL_MASK ^ mask)
+
+
+class Solver:
+    """
+    Negamax with alpha-beta pruning on the bitboards, searching the center columns first, and remembering the
+    positions it has searched in its own transposition table, which is kept from one search to the next
+    """
+
+    def __init__(self, table_size: int = DEFAULT_TABLE_SIZE):
+        self.table_size = table_size
+        # key -> (flag, value, depth, best column)
+        self._table = {}
+        self.nodes = 0
+        self._deadline = float('inf')
+
+    def clear(self):
+        self._table.clear()
+
+    def solve(self, board: Bitboard, player: str, time_limit: float = float('inf')) -> Tuple[int, Optional[int], bool]:
+        """
+        Search [board] deeper and deeper until the result is known or the time runs out
+
+        :param player: 'O' or 'X': who is to move
+        :param time_limit: in seconds
+        :return: (value, column, exact): the value of the position for [player] and the best move found at the
+                 deepest depth searched. Exact is True if the value is the result of the game with perfect play,
+                 otherwise the value is DRAW and the position is still open.
+        """
+        self._deadline = time.monotonic() + time_limit
+        self.nodes = 0
+        position = board.boards[PLAYER_INDEX[player]]
+        mask = board.mask()
+        remaining = BOARD_CELLS - board.moves
+        if len(self._table) > self.table_size:
+            self._table.clear()
+        (value, column, exact) = (DRAW, None, False)
+        # Depths of the same parity as the number of moves left, so that the last ply searched is the same player's
+        for depth in range(2 - remaining % 2, remaining + 1, 2):
+            try:
+                (value, column) = self._root(position, mask, board.moves, depth)
+            except SolverTimeout:
+                break
+            exact = value != DRAW or depth >= remaining
+            if exact:
+                break
+        return (value, column, exact)
+
+    def _root(self, position: int, mask: int, moves: int, depth: int) -> Tuple[int, Optional[int]]:
+        best = (LOSS - 1, None)
+        alpha = LOSS - 1
+        for col in self._ordered_moves(position, mask, self._table.get(position + mask)):
+            move = (mask + BOTTOM_MASK) & COLUMN_MASKS[col]
+            if winning_cells(position, mask) & move:
+                return (WIN, col)
+            value = -self._negamax(position ^ mask, mask | move, moves + 1, depth - 1, LOSS, -alpha)
+            if value > best[0]:
+                best = (value, col)
+                alpha = max(alpha, value)
+                if value == WIN:
+                    break
+        return best
+
+    def _ordered_moves(self, position: int, mask: int, entry) -> list:
+        possible = (mask + BOTTOM_MASK) & FULL_MASK
+        moves = [col for col in CENTER_ORDER if possible & COLUMN_MASKS[col]]
+        if entry is not None and entry[3] in moves:
+            # The best move of the last search of this position first
+            moves.remove(entry[3])
+            moves.insert(0, entry[3])
+        return moves
+
+    def _negamax(self, position: int, mask: int, moves: int, depth: int, alpha: int, beta: int) -> int:
+        """
+        :param position: discs of the player to move
+        :return: the value of the position for the player to move, within [alpha, beta]
+        """
+        self.nodes += 1
+        if self.nodes % CHECK_EVERY == 0 and time.monotonic() > self._deadline:
+            raise SolverTimeout()
+        possible = (mask + BOTTOM_MASK) & FULL_MASK
+        if possible == 0:
+            # Full board, the last disc didn't make a line of four
+            return DRAW
+        if winning_cells(position, mask) & possible:
+            return WIN
+        opponent = position ^ mask
+        threats = winning_cells(opponent, mask)
+        forced = threats & possible
+        if forced:
+            if forced & (forced - 1):
+                # Two threats to block at once
+                return LOSS
+            possible = forced
+        # Never play under a cell where the opponent would win
+        possible &= ~(threats >> 1)
+        if possible == 0:
+            return LOSS
+        remaining = BOARD_CELLS - moves
+        if remaining <= 1:
+            # The last disc can't make a line of four, or it would have been found above
+            return DRAW
+        if depth <= 0:
+            return DRAW
+        # Searched to the end of the game, the value is the same at any depth
+        depth = min(depth, remaining)
+        key = position + mask
+        original_alpha = alpha
+        entry = self._table.get(key)
+        if entry is not None:
+            (flag, value, entry_depth, _) = entry
+            if entry_depth >= depth or value != DRAW:
+                if flag == EXACT:
+                    return value
+                if flag == LOWER:
+                    alpha = max(alpha, value)
+                else:
+                    beta = min(beta, value)
+                if alpha >= beta:
+                    return value
+        best = LOSS - 1
+        best_col = None
+        for col in self._ordered_moves(position, mask, entry):
+            move = possible & COLUMN_MASKS[col]
+            if not move:
+                continue
+            value = -self._negamax(opponent, mask | move, moves + 1, depth - 1, -beta, -alpha)
+            if value > best:
+                best = value
+                best_col = col
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+        if best <= original_alpha:
+            flag = UPPER
+        elif best >= beta:
+            flag = LOWER
+        else:
+            flag = EXACT
+        self._table[key] = (flag, best, depth, best_col)
+        return best
+
+
+def minimax(board: Bitboard, player: str) -> int:
+    """
+    Value of [board] for [player], who is to move, by searching every move to the end of the game. Only usable with
+    few empty cells, to check the solver against.
+    """
+    best = LOSS
+    other = PLAYERS[1 - PLAYER_INDEX[player]]
+    for col in range(BOARD_WIDTH):
+        if not board.can_play(col):
+            continue
+        child = board.copy()
+        child.play(col, player)
+        if child.winner == player:
+            return WIN
+        value = DRAW if child.winner == 'draw' else -minimax(child, other)
+        best = max(best, value)
+    return best
+
+
+def check(positions: int, max_empty: int, seed: int) -> int:
+    """
+    Compare the solver with minimax on positions of random games with 1 to [max_empty] empty cells
+
+    :return: the number of positions where they disagree
+    """
+    rng = random.Random(seed)
+    solver = Solver()
+    errors = 0
+    checked = 0
+    while checked < positions:
+        board = Bitboard()
+        player = 'O'
+        for _ in range(BOARD_CELLS - rng.randint(1, max_empty)):
+            player = PLAYERS[board.moves % 2]
+            board.play(rng.choice([col for col in range(BOARD_WIDTH) if board.can_play(col)]), player)
+            if board.winner is not None:
+                break
+        if board.winner is not None:
+            continue
+        player = PLAYERS[board.moves % 2]
+        (value, _, exact) = solver.solve(board, player)
+        expected = minimax(board, player)
+        checked += 1
+        if not exact or value != expected:
+            errors += 1
+            print("{}: solver {} (exact: {}), minimax {}".format(board, value, exact, expected))
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the solver against minimax on positions of random games.")
+    parser.add_argument('--positions', type=int, default=200, help="number of positions to check")
+    parser.add_argument('--max-empty', type=int, default=10, help="most empty cells of the positions")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the positions")
+    args = parser.parse_args(sys.argv[1:])
+    errors = check(args.positions, args.max_empty, args.seed)
+    print("{} of {} positions wrong".format(errors, args.positions))
+    if errors > 0:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+import time
+from typing import Optional
+
+from .bitboard import BOARD_CELLS
+
+# Thinking time kept aside for the network and the rest of the client, in seconds
+DEFAULT_SAFETY_MARGIN = 0.5
+
+# Least time given to a move, in seconds
+MIN_MOVE_TIME = 0.01
+
+# The time is split between the moves we have left until the board is full, counting at least this many so that
+# the end of the game never gets all the remaining time at once
+MIN_MOVES_LEFT = 4
+
+
+class TimeManager:
+    """
+    Splits a total thinking time for the game between the moves of an agent, instead of giving every move the same
+    time. The time a move doesn't use, e.g. because the search stopped early, goes to the next ones.
+    """
+
+    def __init__(self, total_time: float, safety_margin: float = DEFAULT_SAFETY_MARGIN):
+        """
+        :param total_time: thinking time for the whole game, in seconds
+        :param safety_margin: time never handed out, in seconds
+        """
+        self.total_time = total_time
+        self.remaining = total_time
+        self.safety_margin = safety_margin
+        self._started = None
+
+    def time_for_move(self, moves_played: int) -> float:
+        """
+        Time to spend on the next move
+
+        :param moves_played: number of discs on the board
+        :return: time limit for the move, in seconds
+        """
+        available = self.remaining - self.safety_margin
+        # We play every other move
+        moves_left = max(MIN_MOVES_LEFT, (BOARD_CELLS - moves_played + 1) // 2)
+        return max(MIN_MOVE_TIME, available / moves_left)
+
+    def start_move(self):
+        """ Start counting the time of a move """
+        self._started = time.monotonic()
+
+    def end_move(self) -> Optional[float]:
+        """
+        Stop counting the time of a move, and take it off the remaining time
+
+        :return: the time the move took, or None if start_move wasn't called
+        """
+        if self._started is None:
+            return None
+        elapsed = time.monotonic() - self._started
+        self.remaining -= elapsed
+        self._started = None
+        return elapsed
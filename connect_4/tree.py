@@ -0,0 +1,171 @@
+from array import array
+from typing import Sequence
+
+from .bitboard import Bitboard, BOARD_WIDTH, PLAYER_INDEX
+
+# Default number of nodes allocated for a search tree, about 90 bytes each
+DEFAULT_CAPACITY = 1 << 18
+
+# Index used for a missing node
+NO_NODE = -1
+
+_NO_CHILDREN = array('i', [NO_NODE] * BOARD_WIDTH)
+
+# Values of SearchTree.proven: the result of the position is not known, or it is known to be won or lost by the player
+# who has just played to get to it
+UNPROVEN = 0
+PROVEN_WIN = 1
+PROVEN_LOSS = 2
+
+
+def node_key(state: Bitboard, last_player_index: int) -> int:
+    """
+    Key of a position in the search tree: the bitboard key, together with who has just played
+
+    :param state: the board
+    :param last_player_index: PLAYER_INDEX of the player who has just played
+    :return: an int that is unique to the position
+    """
+    return (state.key() << 1) | last_player_index
+
+
+class SearchTree:
+    """
+    MCTS search tree stored in parallel arrays allocated once, where a node is an index into the arrays.
+
+    Nodes don't store their board: only the board of the root is kept, and the board of a node is rebuilt by playing
+    the moves along the path to it during selection.
+
+    Nodes are also indexed by position in a transposition table, so that a position reached through different move
+    orders is a single node whose visit and win statistics are shared, which makes the tree a DAG. Because of that
+    nodes have no parent index, and the path followed during selection is used for backpropagation instead.
+
+    When all the nodes are used, one that hasn't been visited recently is recycled (CLOCK eviction, an approximation
+    of least recently used). The links to a recycled node from its parents are invalidated by bumping its stamp.
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY):
+        # A path from the root is at most 43 nodes long, and must never be evicted while it is being expanded
+        assert capacity > 64
+        self.capacity = capacity
+        # Number of playouts through each node, and number of wins for the player who has just played to get to it
+        self.visits = array('q', bytes(8 * capacity))
+        self.wins = array('d', bytes(8 * capacity))
+        # PLAYER_INDEX of the player who has just played to get to each node
+        self.players = bytearray(capacity)
+        # Whether the children of each node have been linked
+        self.expanded = bytearray(capacity)
+        # UNPROVEN, PROVEN_WIN or PROVEN_LOSS, for the player who has just played to get to each node
+        self.proven = bytearray(capacity)
+        # Key of each node, see node_key
+        self.keys = array('q', bytes(8 * capacity))
+        # Incremented every time a node is recycled
+        self.stamps = array('i', bytes(4 * capacity))
+        # Children of node n are at n * BOARD_WIDTH + move, with the stamp the child had when it was linked
+        self.children = array('i', [NO_NODE]) * (capacity * BOARD_WIDTH)
+        self.child_stamps = array('i', bytes(4 * capacity * BOARD_WIDTH))
+        # Set when a node is visited, cleared as the eviction clock hand goes past it
+        self.referenced = bytearray(capacity)
+        # Transposition table: key -> node
+        self._index = {}
+        # Number of nodes handed out so far, and position of the clock hand once they all are
+        self._size = 0
+        self._hand = 0
+        # Root of the search, which is never evicted, and its board
+        self.root = NO_NODE
+        self.root_state = None
+        # Depth of the deepest node reached by a search since the root was set
+        self.max_depth = 0
+
+    def __len__(self):
+        return len(self._index)
+
+    def lookup(self, key: int) -> int:
+        """
+        :param key: key of the position, see node_key
+        :return: node of that position, or NO_NODE if it isn't in the tree
+        """
+        return self._index.get(key, NO_NODE)
+
+    def add(self, key: int, last_player_index: int, keep: Sequence[int] = ()) -> int:
+        """
+        Add a node for a position that isn't in the tree yet, recycling a node if the tree is full
+
+        :param key: key of the position, see node_key
+        :param last_player_index: PLAYER_INDEX of the player who has just played to get to the position
+        :param keep: nodes that must not be recycled, e.g. the path being expanded
+        :return: the new node
+        """
+        if self._size < self.capacity:
+            node = self._size
+            self._size += 1
+        else:
+            node = self._evict(keep)
+        self._index[key] = node
+        self.keys[node] = key
+        self.visits[node] = 0
+        self.wins[node] = 0
+        self.players[node] = last_player_index
+        self.expanded[node] = 0
+        self.proven[node] = UNPROVEN
+        self.referenced[node] = 1
+        start = node * BOARD_WIDTH
+        self.children[start:start + BOARD_WIDTH] = _NO_CHILDREN
+        return node
+
+    def _evict(self, keep: Sequence[int]) -> int:
+        referenced = self.referenced
+        while True:
+            node = self._hand
+            self._hand = (node + 1) % self.capacity
+            if referenced[node]:
+                # Second chance
+                referenced[node] = 0
+            elif node != self.root and node not in keep:
+                break
+        del self._index[self.keys[node]]
+        self.stamps[node] += 1
+        return node
+
+    def child(self, node: int, move: int) -> int:
+        """
+        :return: the child of node reached by playing [move], or NO_NODE if it isn't linked or has been recycled
+        """
+        edge = node * BOARD_WIDTH + move
+        child = self.children[edge]
+        if child != NO_NODE and self.child_stamps[edge] == self.stamps[child]:
+            return child
+        return NO_NODE
+
+    def link(self, node: int, move: int, child: int):
+        """ Make [child] the child of node reached by playing [move] """
+        edge = node * BOARD_WIDTH + move
+        self.children[edge] = child
+        self.child_stamps[edge] = self.stamps[child]
+
+    def set_root(self, state: Bitboard, last_player: str) -> int:
+        """
+        Search from [state] from now on, keeping the statistics the tree already has for it and the positions after it
+
+        :param state: the board to search from
+        :param last_player: 'O' or 'X': who has just played to get to state
+        :return: the root node
+        """
+        player_index = PLAYER_INDEX[last_player]
+        key = node_key(state, player_index)
+        node = self.lookup(key)
+        if node == NO_NODE:
+            node = self.add(key, player_index)
+        self.root = node
+        self.root_state = state.copy()
+        self.max_depth = 0
+        return node
+
+    def clear(self):
+        """ Remove all the nodes, keeping the arrays allocated """
+        self._index.clear()
+        self._size = 0
+        self._hand = 0
+        self.root = NO_NODE
+        self.root_state = None
+        self.max_depth = 0
@@ -1,4 +1,6 @@
 import copy
+from dataclasses import dataclass
+from typing import List
 
 import clientlib.wrapper as wrapper
 
@@ -18,6 +20,19 @@ class Connect4Move(wrapper.GenericGameMove):
         }
 
 
+@dataclass(frozen=True)
+class DiscAdded(wrapper.StateChange):
+    """ A disc has been played by [player] (a username) in [column] """
+    column: int
+    player: str
+
+
+@dataclass(frozen=True)
+class BoardReset(wrapper.StateChange):
+    """ The new board doesn't follow from the previous one, so anything derived from it has to be rebuilt """
+    pass
+
+
 class Connect4State(wrapper.GenericGameState):
     """ GameState class for the Connect4 game """
     GAME_BOARD_HEIGHT = 6
@@ -27,13 +42,29 @@ class Connect4State(wrapper.GenericGameState):
         super(Connect4State, self).__init__()
         self.symbol_player_map = {}
 
-    def update_game_state(self, encoded_game_state: dict):
-        super(Connect4State, self).update_game_state(encoded_game_state)
+    def apply_game_state(self, encoded_game_state: dict):
+        super(Connect4State, self).apply_game_state(encoded_game_state)
         if len(self.symbol_player_map) == 0 and len(self.players) == 2:
             # Game has just got enough players: update symbol player map for consistency in the to_O_X method
             self.symbol_player_map[self.players[0]] = 'O'
             self.symbol_player_map[self.players[1]] = 'X'
 
+    def diff_game_state(self, encoded_game_state: dict) -> List[wrapper.StateChange]:
+        changes = super(Connect4State, self).diff_game_state(encoded_game_state)
+        new_cells = encoded_game_state['payload'].get('cells', [])
+        # Before the first update, the board is empty
+        old_cells = self.game_state.get('cells', [[] for _ in new_cells])
+        if len(old_cells) != len(new_cells):
+            return changes + [BoardReset()]
+        discs = []
+        for column, (old, new) in enumerate(zip(old_cells, new_cells)):
+            if new[:len(old)] != old:
+                return changes + [BoardReset()]
+            discs += [DiscAdded(column, player) for player in new[len(old):]]
+        # The order of discs added in different columns since the last update is unknown. There are several of them
+        # only when updates were missed, and then it doesn't matter to rebuild the board.
+        return changes + discs
+
     def validate_move(self, move_) -> bool:
         if isinstance(move_, Connect4Move):
             move_ = move_.move
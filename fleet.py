@@ -0,0 +1,164 @@
+"""
+Fleet mode: play all the games of a config file at once, e.g. for tournaments or load tests against the server.
+
+The config is a JSON list with one object per game:
+
+    [
+        {"type": "connect_4", "agent": "m300", "username": "bot_1"},
+        {"type": "connect_4", "agent": "t", "username": "bot_2", "game": "game_...", "args": ["--ponder", "-c", "30"]}
+    ]
+
+where "type", "agent", "username" and "game" are the -t, -a, -u and -g arguments of main.py, and "args" are any
+other arguments of main.py, except the metrics and profiling ones, see async_main.py. A "game" that isn't a game
+id is a label: one game is created for all the entries with the same label, so that bots of the fleet can play
+against each other. Without a "game", a new game is created for the entry alone. The games are split between worker processes, each playing its share of them with the
+asyncio client of async_main.py, with the agents thinking in threads so that they don't block the requests.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import queue
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import Manager
+from typing import List
+
+import clientlib.wrapper as wrapper
+
+from async_main import check_args, play_games
+from main import make_agent, make_parser
+
+# How often the progress of the fleet is printed, in seconds
+DEFAULT_REPORT_EVERY = 10.0
+
+
+def load_config(path: str) -> List[argparse.Namespace]:
+    """
+    :param path: JSON config file, see the docstring of this module
+    :return: the arguments of each game, as parsed by the parser of main.py
+    """
+    with open(path) as file:
+        config = json.load(file)
+    parser = make_parser()
+    games = []
+    for game in config:
+        argv = ['-t', game['type'], '-a', game['agent'], '-u', game['username']]
+        if game.get('game') is not None:
+            argv += ['-g', game['game']]
+        args = parser.parse_args(argv + game.get('args', []))
+        check_args(parser, args)
+        games.append(args)
+    return games
+
+
+def create_labelled_games(games: List[argparse.Namespace]):
+    """ Replace the labels of the games by the ids of new games, one per label """
+    game_ids = {}
+    with wrapper.make_session() as session:
+        for args in games:
+            if args.game is not None and args.game[0:5] != "game_":
+                if args.game not in game_ids:
+                    game_ids[args.game] = wrapper.GenericGameClient.create_game(args.type, session)
+                args.game = game_ids[args.game]
+
+
+def _play_shard(games: List[argparse.Namespace], progress_queue, verbose: bool) -> List[object]:
+    """ Play some of the games of the fleet in a worker process """
+    def progress(username, game_id, event, moves):
+        progress_queue.put((username, game_id, event, moves))
+
+    agents = []
+    try:
+        for args in games:
+            agent = make_agent(args, args.username)
+            if agent is None:
+                raise ValueError("Agent {} not found for {}".format(args.agent, args.type))
+            agents.append((agent, args.username, args.game, args.type, args.record))
+        # The agents print their search statistics for every move, which is unreadable with many games at once
+        with (contextlib.nullcontext(sys.stdout) if verbose else open(os.devnull, 'w')) as out, \
+                contextlib.redirect_stdout(out):
+            results = asyncio.run(play_games(agents, pool_size=len(agents), progress=progress))
+    finally:
+        # Already done by play_game for the games that have started, this is for the others
+        for (agent, *_) in agents:
+            agent.close()
+    # Exceptions can't always be pickled, so they are sent back to the main process as strings
+    return [result if isinstance(result, bool) else repr(result) for result in results]
+
+
+def count_games(games: List[argparse.Namespace]) -> int:
+    """ Number of different games, once the labels have been replaced, each entry without a game creating its own """
+    return len({args.game for args in games if args.game is not None}) + sum(args.game is None for args in games)
+
+
+class FleetProgress:
+    """ Progress of each game of the fleet, and throughput of the whole fleet """
+
+    def __init__(self, games: int):
+        """
+        :param games: number of different games, bots of the fleet playing against each other being in the same game
+        """
+        self.games = games
+        self.start = time.monotonic()
+        # (username, game id) -> (last event, moves played)
+        self.status = {}
+
+    def update(self, username: str, game_id: str, event: str, moves: int):
+        self.status[(username, game_id)] = (event, moves)
+        if event in ('joined', 'won', 'lost'):
+            print("{}: {} {}".format(username, game_id, event))
+
+    def report(self):
+        elapsed = time.monotonic() - self.start
+        # A game is reported by each of the bots of the fleet playing in it, and is over once one of them has seen
+        # its end
+        started = {game_id for (_, game_id) in self.status}
+        finished = len({game_id for ((_, game_id), (event, _)) in self.status.items() if event in ('won', 'lost')})
+        moves = sum(moves for (_, moves) in self.status.values())
+        print("{:.0f}s: {}/{} games finished, {} being played, {} moves, {:.1f} games/hour, {:.2f} moves/s".format(
+            elapsed, finished, self.games, len(started) - finished, moves, finished * 3600 / elapsed,
+            moves / elapsed))
+        for ((username, game_id), (event, moves)) in sorted(self.status.items()):
+            if event not in ('won', 'lost'):
+                print("    {}: {} {} moves".format(username, game_id, moves))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Play the games of a config file at once.")
+    parser.add_argument('config', type=str, help="JSON file listing the games, see fleet.py")
+    parser.add_argument('--processes', type=int, default=os.cpu_count(), help="number of worker processes")
+    parser.add_argument('--report-every', type=float, default=DEFAULT_REPORT_EVERY,
+                        help="seconds between two progress reports")
+    parser.add_argument('--verbose', action='store_true', help="print the output of the agents")
+    args = parser.parse_args(sys.argv[1:])
+    games = load_config(args.config)
+    create_labelled_games(games)
+    processes = max(1, min(args.processes, len(games)))
+    shards = [games[i::processes] for i in range(processes)]
+
+    fleet_progress = FleetProgress(count_games(games))
+    with Manager() as manager, ProcessPoolExecutor(max_workers=processes) as executor:
+        progress_queue = manager.Queue()
+        futures = [executor.submit(_play_shard, shard, progress_queue, args.verbose) for shard in shards]
+        next_report = time.monotonic() + args.report_every
+        while not all(future.done() for future in futures) or not progress_queue.empty():
+            try:
+                fleet_progress.update(*progress_queue.get(timeout=max(0.0, min(1.0, next_report - time.monotonic()))))
+            except queue.Empty:
+                pass
+            if time.monotonic() >= next_report:
+                fleet_progress.report()
+                next_report += args.report_every
+        results = [result for future in futures for result in future.result()]
+    fleet_progress.report()
+    print("{} out of {} bots won their game".format(sum(result is True for result in results), len(results)))
+    for result in results:
+        if not isinstance(result, bool):
+            print("Game failed: {}".format(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,395 @@
+"""
+Local stand-in for the game server, to play and benchmark without the network.
+
+It implements the create-game, join-game, get-state, submit-move and wait-for-update endpoints for connect_4 and snake,
+with the same JSON payloads as the real server. It can be used:
+- in-process, by giving a LocalSession to GenericGameClient and create_game instead of a requests session
+- over HTTP, by running `python local_server.py --port 8000` and setting GAME_SERVER_BASE_URL=http://localhost:8000
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from connect_4.bitboard import Bitboard, PLAYERS
+from connect_4.utils import Connect4State
+
+# Longest time wait-for-update waits for an update before answering with the same clock, in seconds
+DEFAULT_WAIT_TIMEOUT = 5.0
+
+# Snake world: its corners, the number of fruits in it at any time, and the number of rounds after which the game
+# ends if there is still more than one snake alive
+SNAKE_WORLD_MIN = {'x': 0, 'y': 0}
+SNAKE_WORLD_MAX = {'x': 9, 'y': 9}
+SNAKE_FRUITS = 3
+SNAKE_MAX_ROUNDS = 500
+
+SNAKE_DIRECTIONS = {'left': (-1, 0), 'right': (1, 0), 'up': (0, 1), 'down': (0, -1)}
+
+
+class LocalGame:
+    """ Rules of a game type, with the generic state of the game """
+    players_needed = 2
+
+    def __init__(self):
+        self.players = []
+        self.stage = "waiting"
+        self.can_move = []
+        self.winners = []
+
+    def join(self, username: str) -> bool:
+        if self.stage != "waiting" or username in self.players:
+            return False
+        self.players.append(username)
+        if len(self.players) == self.players_needed:
+            self.stage = "in_progress"
+            self.start()
+        return True
+
+    def start(self):
+        pass
+
+    def submit(self, username: str, payload: dict) -> bool:
+        """ Play the move of [username], if it is valid """
+        pass
+
+    def payload(self) -> dict:
+        pass
+
+    def encode(self) -> dict:
+        return {"players": self.players, "stage": self.stage, "can_move": self.can_move, "winners": self.winners,
+                "payload": self.payload()}
+
+    def end(self, winners: List[str]):
+        self.stage = "ended"
+        self.can_move = []
+        self.winners = winners
+
+
+class LocalConnect4Game(LocalGame):
+    def __init__(self):
+        super(LocalConnect4Game, self).__init__()
+        self.cells = [[] for _ in range(Connect4State.GAME_BOARD_WIDTH)]
+        self.board = Bitboard()
+
+    def start(self):
+        self.can_move = [self.players[0]]
+
+    def submit(self, username: str, payload: dict) -> bool:
+        column = payload.get("column")
+        if username not in self.can_move or not isinstance(column, int) or not 0 <= column < len(self.cells) \
+                or not self.board.can_play(column):
+            return False
+        index = self.players.index(username)
+        self.cells[column].append(username)
+        self.board.play(column, PLAYERS[index])
+        if self.board.winner == 'draw':
+            self.end([])
+        elif self.board.winner is not None:
+            self.end([username])
+        else:
+            self.can_move = [self.players[1 - index]]
+        return True
+
+    def payload(self) -> dict:
+        return {"game_type": "connect_4", "cells": self.cells}
+
+
+class LocalSnakeGame(LocalGame):
+    """
+    Every snake moves at the same time, once all the snakes alive have chosen their direction. A snake dies when it
+    leaves the world or runs into a snake, and grows when it eats a fruit. The game ends when at most one snake is
+    alive, or after SNAKE_MAX_ROUNDS rounds, and is won by the longest snakes alive.
+    """
+
+    def __init__(self, players_needed: int = 2):
+        super(LocalSnakeGame, self).__init__()
+        self.players_needed = players_needed
+        # username -> list of (x, y), head first
+        self.snakes = {}
+        self.fruits = []
+        self.directions = {}
+        self.rounds = 0
+
+    def _free_cell(self) -> Optional[Tuple[int, int]]:
+        taken = set(self.fruits)
+        for body in self.snakes.values():
+            taken.update(body)
+        free = [(x, y) for x in range(SNAKE_WORLD_MIN['x'], SNAKE_WORLD_MAX['x'] + 1)
+                for y in range(SNAKE_WORLD_MIN['y'], SNAKE_WORLD_MAX['y'] + 1) if (x, y) not in taken]
+        return random.choice(free) if len(free) > 0 else None
+
+    def _add_fruits(self):
+        while len(self.fruits) < SNAKE_FRUITS:
+            cell = self._free_cell()
+            if cell is None:
+                return
+            self.fruits.append(cell)
+
+    def start(self):
+        for username in self.players:
+            self.snakes[username] = [self._free_cell()]
+        self._add_fruits()
+        self.can_move = list(self.players)
+
+    def submit(self, username: str, payload: dict) -> bool:
+        direction = payload.get("direction")
+        if username not in self.can_move or direction not in SNAKE_DIRECTIONS:
+            return False
+        self.directions[username] = direction
+        self.can_move.remove(username)
+        if len(self.can_move) == 0:
+            self._play_round()
+        return True
+
+    def _play_round(self):
+        heads = {}
+        for (username, body) in self.snakes.items():
+            (dx, dy) = SNAKE_DIRECTIONS[self.directions[username]]
+            heads[username] = (body[0][0] + dx, body[0][1] + dy)
+        grown = {username for (username, head) in heads.items() if head in self.fruits}
+        for username in self.snakes:
+            self.snakes[username].insert(0, heads[username])
+            if username not in grown:
+                self.snakes[username].pop()
+        self.fruits = [fruit for fruit in self.fruits if fruit not in heads.values()]
+        dead = set()
+        for (username, head) in heads.items():
+            (x, y) = head
+            inside = SNAKE_WORLD_MIN['x'] <= x <= SNAKE_WORLD_MAX['x'] and \
+                SNAKE_WORLD_MIN['y'] <= y <= SNAKE_WORLD_MAX['y']
+            # The bodies have already moved, so running head on into another snake is running into its body too
+            collided = head in self.snakes[username][1:] or \
+                any(head in body for (other, body) in self.snakes.items() if other != username)
+            if not inside or collided:
+                dead.add(username)
+        for username in dead:
+            del self.snakes[username]
+        self.directions = {}
+        self.rounds += 1
+        self._add_fruits()
+        if len(self.snakes) <= (0 if self.players_needed == 1 else 1) or self.rounds >= SNAKE_MAX_ROUNDS:
+            longest = max((len(body) for body in self.snakes.values()), default=0)
+            self.end([username for (username, body) in self.snakes.items() if len(body) == longest])
+        else:
+            self.can_move = list(self.snakes)
+
+    def payload(self) -> dict:
+        return {"game_type": "snake", "world_min": SNAKE_WORLD_MIN, "world_max": SNAKE_WORLD_MAX,
+                "players": {username: [{'x': x, 'y': y} for (x, y) in body]
+                            for (username, body) in self.snakes.items()},
+                "fruits": [{'x': x, 'y': y} for (x, y) in self.fruits]}
+
+
+GAME_TYPES = {"connect_4": LocalConnect4Game, "snake": LocalSnakeGame}
+
+
+class LocalServerError(Exception):
+    def __init__(self, status: int, reason: str):
+        self.status = status
+        self.reason = reason
+        super(LocalServerError, self).__init__(reason)
+
+
+class LocalGameServer:
+    """ The games, and the endpoints of the server """
+
+    def __init__(self, wait_timeout: float = DEFAULT_WAIT_TIMEOUT):
+        self.wait_timeout = wait_timeout
+        self._games = {}
+        # Update clock of each game
+        self._clocks = {}
+        self._sessions = {}
+        self._next_id = 0
+        # Notified at every update of any game
+        self._updated = threading.Condition()
+
+    def _get_game(self, game_id: str) -> LocalGame:
+        if game_id not in self._games:
+            raise LocalServerError(404, "Game not found")
+        return self._games[game_id]
+
+    def _touch(self, game_id: str):
+        self._clocks[game_id] += 1
+        self._updated.notify_all()
+
+    def create_game(self, body: dict) -> dict:
+        with self._updated:
+            if body.get("game_type") not in GAME_TYPES:
+                raise LocalServerError(400, "Unknown game type")
+            self._next_id += 1
+            game_id = "game_{}".format(self._next_id)
+            self._games[game_id] = GAME_TYPES[body["game_type"]]()
+            self._clocks[game_id] = 0
+            return {"game_id": game_id}
+
+    def join_game(self, game_id: str, body: dict) -> dict:
+        with self._updated:
+            if not self._get_game(game_id).join(body.get("username")):
+                raise LocalServerError(400, "Can't join game")
+            session_id = "session_{}_{}".format(game_id, body["username"])
+            self._sessions[session_id] = (game_id, body["username"])
+            self._touch(game_id)
+            return {"session_id": session_id}
+
+    def get_state(self, game_id: str) -> dict:
+        with self._updated:
+            return self._get_game(game_id).encode()
+
+    def submit_move(self, game_id: str, body: dict) -> dict:
+        with self._updated:
+            game = self._get_game(game_id)
+            session = self._sessions.get(body.get("session_id"))
+            if session is None or session[0] != game_id:
+                raise LocalServerError(403, "Invalid session")
+            success = game.submit(session[1], body.get("payload", {}))
+            if success:
+                self._touch(game_id)
+            return {"success": success}
+
+    def wait_for_update(self, game_id: str, since: int, timeout: Optional[float] = None) -> dict:
+        timeout = self.wait_timeout if timeout is None else min(timeout, self.wait_timeout)
+        with self._updated:
+            game = self._get_game(game_id)
+            # Answers at once if the game has changed since the caller's clock, or if it has ended and never will, and
+            # otherwise as soon as _touch notifies an update, so that in-process games never wait for the timeout
+            self._updated.wait_for(lambda: self._clocks[game_id] > since or game.stage == "ended", timeout=timeout)
+            return {"clock": self._clocks[game_id]}
+
+    def handle(self, method: str, url: str, params: dict, body: Optional[dict],
+               timeout: Optional[float] = None) -> dict:
+        """
+        Answer a request to an endpoint
+
+        :param url: URL of the request, only its path is used
+        :param params: query parameters
+        :param body: JSON body of a POST request
+        :param timeout: time the client waits for the answer, so that wait-for-update answers before it
+        :return: the JSON answer
+        :raise LocalServerError: with the HTTP status of the error
+        """
+        path = [part for part in urlparse(url).path.split('/') if part != '']
+        if method == 'POST' and path == ['api', 'create-game']:
+            return self.create_game(body)
+        if len(path) == 3 and path[0] == 'api':
+            (_, game_id, endpoint) = path
+            if method == 'POST' and endpoint == 'join-game':
+                return self.join_game(game_id, body)
+            if method == 'POST' and endpoint == 'submit-move':
+                return self.submit_move(game_id, body)
+            if method == 'GET' and endpoint == 'get-state':
+                return self.get_state(game_id)
+            if method == 'GET' and endpoint == 'wait-for-update':
+                return self.wait_for_update(game_id, int(params.get("since", 0)), timeout)
+        raise LocalServerError(404, "Not found")
+
+
+class LocalResponse:
+    """ The part of requests.Response used by GenericGameClient """
+
+    def __init__(self, status_code: int, reason: str, content: bytes):
+        self.status_code = status_code
+        self.reason = reason
+        self.ok = status_code < 400
+        self.content = content
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class LocalSession:
+    """
+    In-process transport: can be given to GenericGameClient instead of a requests session, to send its requests to a
+    LocalGameServer directly. The answers are encoded to JSON and decoded back, as they would be over the network,
+    so that the client never shares objects with the server.
+    """
+
+    def __init__(self, server: Optional[LocalGameServer] = None):
+        self.server = server if server is not None else LocalGameServer()
+
+    def _request(self, method: str, url: str, params: dict, body: Optional[dict], timeout) -> LocalResponse:
+        # The read timeout of a (connect, read) tuple is the one that matters here
+        timeout = timeout[1] if isinstance(timeout, tuple) else timeout
+        try:
+            answer = self.server.handle(method, url, params or {}, body, timeout)
+        except LocalServerError as e:
+            return LocalResponse(e.status, e.reason, b'')
+        return LocalResponse(200, "OK", json.dumps(answer).encode())
+
+    def get(self, url: str, params: dict = None, timeout=None) -> LocalResponse:
+        return self._request('GET', url, params, None, timeout)
+
+    def post(self, url: str, json: dict = None, timeout=None) -> LocalResponse:
+        return self._request('POST', url, {}, json, timeout)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def make_request_handler(server: LocalGameServer):
+    """ HTTP request handler class answering with [server] """
+
+    class LocalRequestHandler(BaseHTTPRequestHandler):
+        # Keep the connections alive, like the real server
+        protocol_version = 'HTTP/1.1'
+
+        def _answer(self, method: str, body: Optional[dict]):
+            url = urlparse(self.path)
+            params = {key: values[0] for (key, values) in parse_qs(url.query).items()}
+            try:
+                (status, content) = (200, json.dumps(server.handle(method, self.path, params, body)).encode())
+            except LocalServerError as e:
+                (status, content) = (e.status, json.dumps({"error": e.reason}).encode())
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            self._answer('GET', None)
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length', 0))
+            self._answer('POST', json.loads(self.rfile.read(length)) if length > 0 else {})
+
+        def log_message(self, format, *args):
+            pass
+
+    return LocalRequestHandler
+
+
+def serve(port: int, server: Optional[LocalGameServer] = None) -> ThreadingHTTPServer:
+    """ Start answering HTTP requests on [port] in a background thread, until shutdown() is called on the result """
+    http_server = ThreadingHTTPServer(('', port), make_request_handler(server or LocalGameServer()))
+    http_server.daemon_threads = True
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    return http_server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the game server.")
+    parser.add_argument('--port', type=int, default=8000, help="port to listen on")
+    args = parser.parse_args(sys.argv[1:])
+    http_server = serve(args.port)
+    print("Serving on http://localhost:{}, set GAME_SERVER_BASE_URL to it".format(args.port))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        http_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,64 +1,99 @@
 import sys
 import argparse
+import logging
+import os
 
 import clientlib.wrapper as wrapper
+from clientlib.instrumentation import Instrumentation, make_instrumentation
+from clientlib.recording import GameRecorder
 
 from connect_4.agents import Connect4InteractiveAgent, Connect4RandomAgent, Connect4MCTSAgent
+from connect_4.mcts import ROLLOUT_POLICIES
+from connect_4.opening_book import OpeningBook
+from connect_4.parallel import PARALLEL_MODES
+from connect_4.time_manager import TimeManager
 from connect_4.utils import Connect4State
 from connect_4.your_own_bot import Connect4UserDefinedAgent
 
-from snake.agents import SnakeInteractiveAgent, SnakeRandomAgent, SnakeGoForFruitAgent
+from snake.agents import SnakeInteractiveAgent, SnakeRandomAgent, SnakeGoForFruitAgent, SnakeSearchAgent
 from snake.utils import SnakeState
 from snake.your_own_bot import SnakeUserDefinedAgent
 
 
-def main(agent, username, game_id, game_type):
+def main(agent, username, game_id, game_type, instrumentation=None, record_dir=None):
+    # The connections to the server are kept alive for the whole game
+    with wrapper.make_session() as session:
+        play_game(agent, username, game_id, game_type, session, instrumentation, record_dir)
+
+
+def play_game(agent, username, game_id, game_type, session, instrumentation=None, record_dir=None):
+    if instrumentation is None:
+        instrumentation = Instrumentation()
     # Create game ?
     if game_id is None or game_id[0:5] != "game_":
-        game_id = wrapper.GenericGameClient.create_game(game_type)
+        game_id = wrapper.GenericGameClient.create_game(game_type, session)
     print("Using game_id: {}".format(game_id))
-    # Join game ?
-    client = wrapper.GenericGameClient(game_type, game_id, username)
-    client.join_game()
-    # Now wait until others join
-    state = None
+    # Every line of the recording is flushed as soon as it is written, so it is kept even if the game fails
+    recorder = None
+    if record_dir is not None:
+        recorder = GameRecorder(os.path.join(record_dir, "{}_{}.jsonl".format(game_id, username)), game_type,
+                                game_id, username)
+    try:
+        # Join game ?
+        client = wrapper.GenericGameClient(game_type, game_id, username, session, instrumentation=instrumentation,
+                                           recorder=recorder)
+        client.join_game()
+        # Now wait until others join
+        state = new_state(game_type)
 
-    if game_type == 'connect_4':
-        state = Connect4State()
-    elif game_type == 'snake':
-        state = SnakeState()
-
-    client.update_state(state)
-    while state.is_waiting_for_start():
-        while not client.wait_for_update():
-            continue
         client.update_state(state)
-        print("Waiting")
-    # Now players should have joined and the game started
-    print("Game started.")
-    while state.is_in_progress():
-        # If you can make move
-        if state.player_can_move(client.username):
-            print(state)
-            # Make Move
-            client.submit_move(move=agent.get_next_move(state))
-            client.update_state(state)
-            print(state)
-        # Spin while waiting for update
-        while not client.wait_for_update():
+        while state.is_waiting_for_start():
+            while not client.wait_for_state(state):
+                continue
             print("Waiting")
-            continue
-        client.update_state(state)
+        # Now players should have joined and the game started
+        print("Game started.")
+        while state.is_in_progress():
+            # If you can make move
+            if state.player_can_move(client.username):
+                print(state)
+                # Make Move. The state with it is the next update.
+                with instrumentation.move():
+                    move = agent.get_next_move(state)
+                client.submit_move(move=move)
+                # A turn is recorded from the end of the previous one, waiting for the others included
+                instrumentation.end_turn()
+            else:
+                # Use the time the others take to think, if the agent can
+                agent.ponder(state)
+            # Spin while waiting for update
+            with instrumentation.timer('wait'):
+                while not client.wait_for_state(state):
+                    print("Waiting")
+                    continue
+            agent.stop_pondering()
 
-    # Game Ended
-    if client.username in state.winners:
-        print("You won")
-    else:
-        print("You lost")
-    print(state)
+        # Game Ended
+        if client.username in state.winners:
+            print("You won")
+        else:
+            print("You lost")
+        print(state)
+    finally:
+        agent.close()
+        if recorder is not None:
+            recorder.close()
 
 
-if __name__ == '__main__':
+def new_state(game_type):
+    if game_type == 'connect_4':
+        return Connect4State()
+    elif game_type == 'snake':
+        return SnakeState()
+    return None
+
+
+def make_parser():
     parser = argparse.ArgumentParser(description="Main script for the game client.")
     parser.add_argument('-t', '--type', type=str, help="type of game, currently supported "
                                                        "are connect_4 and snake",
@@ -67,40 +102,115 @@ if __name__ == '__main__':
                                                         "for random; u for user-defined; "
                                                         "(only if game type is connect_4) "
                                                         "m<t> where t=50|300|700|1000|3000(ms of computation time); "
+                                                        "t for MCTS with a total thinking time for the game (see "
+                                                        "--clock); "
                                                         "(only if game type is snake) "
-                                                        "f for snake bot that goes for the first fruit in the list",
+                                                        "f for snake bot that goes for the closest fruit it can reach; "
+                                                        "s<t> where t=100|300|1000 (ms of computation time) for "
+                                                        "snake bot searching ahead with a simulator",
                         required=True)
     parser.add_argument('-u', '--username', type=str, help="the username given to the bot.", required=True)
     parser.add_argument('-g', '--game', type=str, help='the game id. If None, will create a new game.')
-    parsed_args = parser.parse_args(sys.argv[1:])
-
-    connect_4_agent_map = {
-        "i": Connect4InteractiveAgent(),
-        "r": Connect4RandomAgent(parsed_args.username),
-        "m50": Connect4MCTSAgent(parsed_args.username, 0.05, False),
-        "m300": Connect4MCTSAgent(parsed_args.username, 0.3, False),
-        "m700": Connect4MCTSAgent(parsed_args.username, 0.7, False),
-        "m1000": Connect4MCTSAgent(parsed_args.username, 1, False),
-        "m3000": Connect4MCTSAgent(parsed_args.username, 3, False),
-        "u": Connect4UserDefinedAgent(parsed_args.username)
-    }
-
-    snake_agent_map = {
-        "i": SnakeInteractiveAgent(),
-        "r": SnakeRandomAgent(parsed_args.username),
-        "f": SnakeGoForFruitAgent(parsed_args.username),
-        "u": SnakeUserDefinedAgent(parsed_args.username)
-    }
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help="(only for m<t> and t agents) number of processes to search with.")
+    parser.add_argument('-p', '--parallel', type=str, default='root', choices=PARALLEL_MODES,
+                        help="(only for m<t> and t agents with more than one worker) root: search independent "
+                             "trees in each process; leaf: search one tree, with rollouts done in the worker "
+                             "processes.")
+    parser.add_argument('-b', '--batch-size', type=int, default=1,
+                        help="(only for m<t> and t agents) number of rollouts done at once from each leaf, "
+                             "with NumPy if more than 1.")
+    parser.add_argument('-c', '--clock', type=float, default=60,
+                        help="(only for the t agent) total thinking time for the game, in seconds.")
+    parser.add_argument('--ponder', action='store_true',
+                        help="(only for m<t> and t agents) keep searching while the opponent thinks.")
+    parser.add_argument('--book', type=str,
+                        help="(only for m<t> and t agents) opening book to play the first moves from, generated with "
+                             "`python -m connect_4.opening_book`.")
+    parser.add_argument('--endgame-cells', type=int, default=Connect4MCTSAgent.DEFAULT_ENDGAME_CELLS,
+                        help="(only for m<t> and t agents) number of empty cells from which positions are given to the "
+                             "exact solver first, 0 to never use it.")
+    parser.add_argument('--rollout', type=str, default='random', choices=list(ROLLOUT_POLICIES),
+                        help="(only for m<t> and t agents) how the moves of the rollouts are chosen: random; "
+                             "win_block: win if possible, else block the opponent's win; center: central columns "
+                             "first; lines: cells with the most open lines of four first. Only random works with -b.")
+    parser.add_argument('--record', type=str,
+                        help="directory to record the game in, as <game id>_<username>.jsonl, to be replayed with "
+                             "replay.py.")
+    parser.add_argument('--metrics-log', action='store_true',
+                        help="log the time of each phase and the counters of every turn.")
+    parser.add_argument('--metrics-csv', type=str, help="append the metrics of every turn to this CSV file.")
+    parser.add_argument('--metrics-prometheus', type=str,
+                        help="keep the totals of the metrics in this file, for the textfile collector of the "
+                             "Prometheus node exporter.")
+    parser.add_argument('--profile-move', type=int, action='append', default=[],
+                        help="capture a cProfile of our n-th move (from 1), can be given several times.")
+    parser.add_argument('--profile-path', type=str, default='move_{}.prof',
+                        help="file the profile of a move is written to, {} being replaced by its number.")
+    return parser
+
 
+def make_agent(parsed_args, username, instrumentation=None):
+    """
+    Create a new agent, as given by the command line arguments
+
+    :param parsed_args: arguments parsed by the parser of make_parser
+    :param username: the username given to the agent
+    :param instrumentation: given to the agents that record their own metrics
+    :return: the agent, or None if there is no such agent for the game type
+    """
     if parsed_args.type == "connect_4":
-        if parsed_args.agent not in connect_4_agent_map:
-            print("Agent not found")
-        else:
-            main(connect_4_agent_map[parsed_args.agent], parsed_args.username, parsed_args.game, parsed_args.type)
+        book = OpeningBook(parsed_args.book) if parsed_args.book is not None else None
+
+        def mcts_agent(timelimit, time_manager=None):
+            return Connect4MCTSAgent(username, timelimit, False, parsed_args.workers, parsed_args.parallel,
+                                     parsed_args.batch_size, parsed_args.ponder, time_manager, book, instrumentation,
+                                     parsed_args.endgame_cells, parsed_args.rollout)
+
+        agent_map = {
+            "i": Connect4InteractiveAgent,
+            "r": lambda: Connect4RandomAgent(username),
+            "m50": lambda: mcts_agent(0.05),
+            "m300": lambda: mcts_agent(0.3),
+            "m700": lambda: mcts_agent(0.7),
+            "m1000": lambda: mcts_agent(1),
+            "m3000": lambda: mcts_agent(3),
+            "t": lambda: mcts_agent(0, TimeManager(parsed_args.clock)),
+            "u": lambda: Connect4UserDefinedAgent(username)
+        }
     elif parsed_args.type == "snake":
-        if parsed_args.agent not in snake_agent_map:
-            print("Agent not found")
-        else:
-            main(snake_agent_map[parsed_args.agent], parsed_args.username, parsed_args.game, parsed_args.type)
+        agent_map = {
+            "i": SnakeInteractiveAgent,
+            "r": lambda: SnakeRandomAgent(username),
+            "f": lambda: SnakeGoForFruitAgent(username),
+            "s100": lambda: SnakeSearchAgent(username, 0.1),
+            "s300": lambda: SnakeSearchAgent(username, 0.3),
+            "s1000": lambda: SnakeSearchAgent(username, 1),
+            "u": lambda: SnakeUserDefinedAgent(username)
+        }
     else:
+        return None
+    if parsed_args.agent not in agent_map:
+        return None
+    return agent_map[parsed_args.agent]()
+
+
+if __name__ == '__main__':
+    parsed_args = make_parser().parse_args(sys.argv[1:])
+    if parsed_args.type not in ("connect_4", "snake"):
         print("Game type invalid")
+    else:
+        if parsed_args.metrics_log:
+            logging.basicConfig(level=logging.INFO, format="%(message)s")
+        instrumentation = make_instrumentation(parsed_args.metrics_log, parsed_args.metrics_csv,
+                                               parsed_args.metrics_prometheus, parsed_args.profile_move,
+                                               parsed_args.profile_path)
+        agent = make_agent(parsed_args, parsed_args.username, instrumentation)
+        if agent is None:
+            print("Agent not found")
+        else:
+            try:
+                main(agent, parsed_args.username, parsed_args.game, parsed_args.type, instrumentation,
+                     parsed_args.record)
+            finally:
+                instrumentation.close()
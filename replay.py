@@ -0,0 +1,92 @@
+"""
+Replay recorded games offline: an agent is asked for a move in every position where the recorded player had to move,
+and its moves are compared with the recorded ones.
+
+    python replay.py "m300 -b 32" recordings/*.jsonl [--out positions.jsonl]
+
+Games are recorded with the --record argument of main.py. The agent is given as the -a argument of main.py followed
+by any other arguments of main.py, and plays as the recorded player. With --out, every position is written out with
+the recorded move and the move of the agent, e.g. as a regression corpus or as training data.
+"""
+import argparse
+import contextlib
+import io
+import json
+import random
+import sys
+import time
+
+from arena import make_player
+from clientlib.recording import read_recording
+from main import new_state
+
+
+def replay(path: str, spec: str, out=None, verbose: bool = False):
+    """
+    :param path: the recording
+    :param spec: the agent, see arena.make_player
+    :param out: file to write each position to, as JSON lines
+    :return: the number of positions, the number of them where the agent played the recorded move, and the thinking
+             time of the agent in CPU seconds
+    """
+    recording = read_recording(path)
+    agent = make_player(recording.game_type, spec, recording.username)
+    try:
+        # The agent is given the states in order, so that agents following the changes of the state see all of them
+        state = new_state(recording.game_type)
+        (positions, same, cpu_time) = (0, 0, 0.0)
+        for (encoded_game_state, recorded_move) in recording.states():
+            state.update_game_state(encoded_game_state)
+            if not state.is_in_progress() or not state.player_can_move(recording.username):
+                continue
+            start = time.process_time()
+            move = agent.get_next_move(state).encode_game_move()
+            cpu_time += time.process_time() - start
+            positions += 1
+            same += move == recorded_move
+            if verbose and move != recorded_move:
+                print("{}: played {} instead of {} in".format(path, move, recorded_move))
+                print(state)
+            if out is not None:
+                out.write(json.dumps({"recording": path, "state": encoded_game_state, "recorded_move": recorded_move,
+                                      "move": move}, separators=(',', ':')) + '\n')
+    finally:
+        agent.close()
+    return (positions, same, cpu_time)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded games with an agent.")
+    parser.add_argument('agent', type=str,
+                        help="the agent, as the -a argument of main.py followed by other arguments of main.py")
+    parser.add_argument('recordings', type=str, nargs='+', help="recordings made with the --record argument of main.py")
+    parser.add_argument('--out', type=str, help="file to write every position to, with both moves, as JSON lines")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the random generator of the agent")
+    parser.add_argument('--verbose', action='store_true',
+                        help="print the positions where the agent doesn't play the recorded move, and the output "
+                             "of the agent")
+    args = parser.parse_args(sys.argv[1:])
+
+    random.seed(args.seed)
+    out = open(args.out, 'w') if args.out is not None else None
+    (total_positions, total_same, total_time) = (0, 0, 0.0)
+    try:
+        for path in args.recordings:
+            # The agents print their search statistics for every move
+            with contextlib.redirect_stdout(sys.stdout if args.verbose else io.StringIO()):
+                (positions, same, cpu_time) = replay(path, args.agent, out, args.verbose)
+            print("{}: {} positions, {} recorded moves played, {:.2f} ms/move".format(
+                path, positions, same, 1000 * cpu_time / max(1, positions)))
+            total_positions += positions
+            total_same += same
+            total_time += cpu_time
+    finally:
+        if out is not None:
+            out.close()
+    print("{} recordings, {} positions, {:.1f}% of the recorded moves played, {:.2f} ms/move".format(
+        len(args.recordings), total_positions, 100 * total_same / max(1, total_positions),
+        1000 * total_time / max(1, total_positions)))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,5 +1,8 @@
 import random
+import time
 
+from snake.pathfinding import UNREACHABLE, Pathfinder
+from snake.simulator import WIN_SCORE, SnakeSimulator, random_playouts, search_depth
 from snake.utils import SnakeState, SnakeMove
 
 
@@ -7,6 +10,18 @@ class SnakeBaseAgent:
     def get_next_move(self, state: SnakeState) -> SnakeMove:
         pass
 
+    def ponder(self, state: SnakeState):
+        """ Called with the state after our move, while waiting for the other players """
+        pass
+
+    def stop_pondering(self):
+        """ Called when the state has been updated, or the game has ended """
+        pass
+
+    def close(self):
+        """ Called once the agent won't be used anymore, to free what it holds, e.g. processes """
+        pass
+
 
 class SnakeInteractiveAgent(SnakeBaseAgent):
     move_conversion_table = {
@@ -32,24 +47,96 @@ class SnakeRandomAgent(SnakeBaseAgent):
 
 
 class SnakeGoForFruitAgent(SnakeBaseAgent):
+    """
+    Goes for the closest fruit it can reach, avoiding the moves that run into something and, when it can, the
+    moves into areas too small to hold its body
+    """
+
     def __init__(self, username: str):
         self._username = username
-        self._fruit = None
+        self._pathfinder = None
+
+    def get_next_move(self, state: SnakeState):
+        moves = state.safe_moves(self._username)
+        if len(moves) == 0:
+            # Every move loses
+            return SnakeMove(random.choice(state.valid_moves(self._username) or ["up"]))
+        self._pathfinder = Pathfinder.for_state(state, self._pathfinder)
+        grid = state.grid
+        body = state.game_state["players"][self._username]
+        head = state.cell_index(body[0]['x'], body[0]['y'])
+        cells = {move: self._pathfinder.steps[move][head] for move in moves}
+        space = {move: self._pathfinder.flood_fill(grid, cell, len(body) + 1) for (move, cell) in cells.items()}
+        roomy = [move for move in moves if space[move] > len(body)]
+        if len(roomy) == 0:
+            # Stay in the biggest area, hoping that it opens up
+            return SnakeMove(max(moves, key=lambda move: space[move]))
+        fruits = [state.cell_index(fruit['x'], fruit['y']) for fruit in state.game_state['fruits']]
+        distances = self._pathfinder.distance_field(grid, [fruit for fruit in fruits if fruit >= 0],
+                                                    [cells[move] for move in roomy])
+        reachable = [move for move in roomy if distances[cells[move]] != UNREACHABLE]
+        if len(reachable) == 0:
+            return SnakeMove(random.choice(roomy))
+        closest = min(distances[cells[move]] for move in reachable)
+        return SnakeMove(random.choice([move for move in reachable if distances[cells[move]] == closest]))
+
+
+class SnakeSearchAgent(SnakeBaseAgent):
+    """
+    Looks ahead with the simulator: a paranoid search deepened until a share of its time is used, and random futures
+    simulated in batches with the rest of it, to choose between the moves the search finds equally good
+    """
+
+    # Share of the time given to the search
+    SEARCH_SHARE = 0.5
+    # Number of futures simulated for each move at once, and their length in rounds
+    PLAYOUT_BATCH = 8
+    PLAYOUT_DEPTH = 10
+
+    def __init__(self, username: str, time_limit: float, max_depth: int = 30):
+        """
+        :param time_limit: in seconds, thinking time of each move
+        :param max_depth: number of rounds the search looks ahead at most
+        """
+        self._username = username
+        self._time_limit = time_limit
+        self._max_depth = max_depth
+        self._pathfinder = None
+        self._rng = random.Random()
 
     def get_next_move(self, state: SnakeState):
-        player_head = state.game_state["players"][self._username][0]
-        if len(state.game_state['fruits']) == 0:
-            return SnakeMove(random.choice(state.valid_moves(self._username)))
-        else:
-            if self._fruit is None or self._fruit not in state.game_state['fruits']:
-                self._fruit = state.game_state['fruits'][0]
-            directions = []
-            if player_head['x'] < self._fruit['x']:
-                directions.append('right')
-            elif player_head['x'] > self._fruit['x']:
-                directions.append('left')
-            if player_head['y'] < self._fruit['y']:
-                directions.append('up')
-            elif player_head['y'] > self._fruit['y']:
-                directions.append('down')
-            return SnakeMove(random.choice(directions))
+        start = time.monotonic()
+        simulator = SnakeSimulator.from_state(state, self._pathfinder)
+        self._pathfinder = simulator.pathfinder
+        moves = simulator.safe_moves(self._username)
+        if len(moves) == 0:
+            return SnakeMove(random.choice(state.valid_moves(self._username) or ["up"]))
+        if len(moves) == 1:
+            return SnakeMove(moves[0])
+        values = {move: 0.0 for move in moves}
+        depth = 0
+        search_deadline = start + self.SEARCH_SHARE * self._time_limit
+        while depth < self._max_depth:
+            try:
+                values = dict(search_depth(simulator, self._username, depth + 1, search_deadline, time.monotonic))
+            except TimeoutError:
+                break
+            depth += 1
+            # Nothing to gain from looking further once the game is decided
+            best = max(values.values())
+            if best > WIN_SCORE / 2 or best < -WIN_SCORE / 2:
+                break
+        best = max(values.values())
+        candidates = [move for move in moves if values[move] == best]
+        playouts = 0
+        if len(candidates) > 1:
+            totals = {move: 0.0 for move in candidates}
+            while time.monotonic() < start + self._time_limit:
+                for move in candidates:
+                    totals[move] += random_playouts(simulator, self._username, move, self.PLAYOUT_BATCH,
+                                                    self.PLAYOUT_DEPTH, self._rng)
+                playouts += self.PLAYOUT_BATCH
+            if playouts > 0:
+                candidates = [max(candidates, key=lambda move: totals[move])]
+        print("--SEARCH-- depth {}, values {}, {} futures per move".format(depth, values, playouts))
+        return SnakeMove(random.choice(candidates))
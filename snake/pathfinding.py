@@ -0,0 +1,151 @@
+import heapq
+from array import array
+from typing import List, Optional, Sequence
+
+from snake.utils import CELL_FRUIT, DIRECTIONS, SnakeState
+
+# Distance of the cells that can't be reached, see Pathfinder.distance_field
+UNREACHABLE = -1
+
+
+class Pathfinder:
+    """
+    Searches on the occupancy grid of a SnakeState, where cells are numbered as by SnakeState.cell_index and a cell
+    can be walked on if it is empty or has a fruit. The buffers are allocated once for a world size, so that a
+    pathfinder can be kept from one move to the next.
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        cells = width * height
+        # move -> the cell reached from each cell by the move, or -1 if it leaves the world
+        self.steps = {}
+        for (move, (dx, dy)) in DIRECTIONS.items():
+            self.steps[move] = array('i', [(y + dy) * width + x + dx if 0 <= x + dx < width and 0 <= y + dy < height
+                                           else -1 for y in range(height) for x in range(width)])
+        # Neighbours of each cell in the world
+        self.neighbors = [tuple(step[cell] for step in self.steps.values() if step[cell] >= 0)
+                          for cell in range(cells)]
+        self.distances = array('i', [UNREACHABLE]) * cells
+        self._unreached = array('i', [UNREACHABLE]) * cells
+        self._queue = array('i', bytes(4 * cells))
+        self._seen = bytearray(cells)
+        self._no_cells = bytes(cells)
+        self._came_from = array('i', [-1]) * cells
+
+    @staticmethod
+    def for_state(state: SnakeState, pathfinder: Optional['Pathfinder'] = None) -> 'Pathfinder':
+        """ :return: [pathfinder] if it fits the world of [state], otherwise a new one that does """
+        if pathfinder is not None and (pathfinder.width, pathfinder.height) == (state.width, state.height):
+            return pathfinder
+        return Pathfinder(state.width, state.height)
+
+    def distance_field(self, grid: bytearray, sources: Sequence[int], targets: Sequence[int] = ()) -> array:
+        """
+        Multi-source breadth-first search: the number of moves from each cell to the closest of [sources]
+
+        :param grid: occupancy grid, see SnakeState.grid
+        :param sources: cells to measure the distance from, e.g. all the fruits
+        :param targets: if given, the search stops as soon as the distance of all of them is known
+        :return: the distance of each cell, or UNREACHABLE. The array is overwritten by the next call.
+        """
+        distances = self.distances
+        distances[:] = self._unreached
+        queue = self._queue
+        tail = 0
+        for source in sources:
+            if distances[source] == UNREACHABLE:
+                distances[source] = 0
+                queue[tail] = source
+                tail += 1
+        targets = set(targets)
+        remaining = sum(1 for target in targets if distances[target] == UNREACHABLE)
+        neighbors = self.neighbors
+        head = 0
+        while head < tail:
+            cell = queue[head]
+            head += 1
+            distance = distances[cell] + 1
+            for neighbor in neighbors[cell]:
+                if distances[neighbor] == UNREACHABLE:
+                    # Targets are reached even when they can't be walked on, e.g. the head of a snake
+                    if remaining > 0 and neighbor in targets:
+                        distances[neighbor] = distance
+                        remaining -= 1
+                        if remaining == 0:
+                            return distances
+                    if grid[neighbor] <= CELL_FRUIT:
+                        distances[neighbor] = distance
+                        queue[tail] = neighbor
+                        tail += 1
+        return distances
+
+    def a_star(self, grid: bytearray, start: int, goal: int) -> Optional[List[int]]:
+        """
+        Shortest path from [start], which doesn't have to be walkable (e.g. a head), to [goal]
+
+        :return: the cells of the path, [start] excluded and [goal] included, or None if there is none
+        """
+        width = self.width
+        (goal_x, goal_y) = (goal % width, goal // width)
+        g = self.distances
+        g[:] = self._unreached
+        came_from = self._came_from
+        g[start] = 0
+        heap = [(abs(start % width - goal_x) + abs(start // width - goal_y), 0, start)]
+        neighbors = self.neighbors
+        while len(heap) > 0:
+            (_, cost, cell) = heapq.heappop(heap)
+            if cell == goal:
+                path = []
+                while cell != start:
+                    path.append(cell)
+                    cell = came_from[cell]
+                path.reverse()
+                return path
+            if cost > g[cell]:
+                # Already reached at a lower cost
+                continue
+            cost += 1
+            for neighbor in neighbors[cell]:
+                if grid[neighbor] <= CELL_FRUIT and (g[neighbor] == UNREACHABLE or cost < g[neighbor]):
+                    g[neighbor] = cost
+                    came_from[neighbor] = cell
+                    heapq.heappush(heap, (cost + abs(neighbor % width - goal_x) + abs(neighbor // width - goal_y),
+                                          cost, neighbor))
+        return None
+
+    def flood_fill(self, grid: bytearray, start: int, limit: int = -1) -> int:
+        """
+        :param start: walkable cell to fill from, e.g. the cell a move leads to
+        :param limit: if positive, stop counting once this many cells have been reached
+        :return: the number of walkable cells reachable from [start], [start] included, or 0 if it isn't walkable
+        """
+        if start < 0 or grid[start] > CELL_FRUIT:
+            return 0
+        seen = self._seen
+        seen[:] = self._no_cells
+        queue = self._queue
+        neighbors = self.neighbors
+        seen[start] = 1
+        queue[0] = start
+        (head, tail) = (0, 1)
+        while head < tail:
+            if 0 < limit <= tail:
+                return limit
+            cell = queue[head]
+            head += 1
+            for neighbor in neighbors[cell]:
+                if not seen[neighbor] and grid[neighbor] <= CELL_FRUIT:
+                    seen[neighbor] = 1
+                    queue[tail] = neighbor
+                    tail += 1
+        return min(tail, limit) if limit > 0 else tail
+
+    def move_between(self, cell: int, neighbor: int) -> Optional[str]:
+        """ :return: the move from [cell] to its neighbour [neighbor], or None if they aren't neighbours """
+        for (move, step) in self.steps.items():
+            if step[cell] == neighbor:
+                return move
+        return None
@@ -0,0 +1,266 @@
+import random
+import sys
+from collections import deque
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from snake.pathfinding import Pathfinder, UNREACHABLE
+from snake.utils import CELL_FRUIT, DIRECTIONS, SnakeState
+
+# A cell of the grid holds CELL_FRUIT if it has a fruit, plus SEGMENT for each segment of snake in it, so that cells
+# can be walked on when they hold at most CELL_FRUIT, as in SnakeState.grid, and a head has run into something when
+# its cell holds two segments
+SEGMENT = 2
+COLLISION = 2 * SEGMENT
+
+# Score of a won game, see evaluate
+WIN_SCORE = 1000000
+
+
+class SnakeSimulator:
+    """
+    Forward model of the snake rules, as played by the local server: all the snakes move at once, a snake grows when
+    its head reaches a fruit, and dies when its head leaves the world or runs into a snake (its own body included) once
+    they have all moved. The fruits added by the server are unknown, so no fruit is added.
+
+    step() returns what is needed to undo it, so that a search can play moves in place and take them back.
+    """
+
+    def __init__(self, pathfinder: Pathfinder, snakes: Dict[str, Iterable[int]], fruits: Iterable[int],
+                 players: int, rounds: int = 0, max_rounds: int = sys.maxsize):
+        """
+        :param pathfinder: pathfinder of the size of the world, whose tables give the cell reached by each move
+        :param snakes: username -> cells of its snake, head first
+        :param fruits: cells with a fruit
+        :param players: number of players the game started with
+        :param max_rounds: the game ends after this many rounds
+        """
+        self.pathfinder = pathfinder
+        self.snakes = {username: deque(body) for (username, body) in snakes.items()}
+        self.fruits = set(fruits)
+        self.players = players
+        self.rounds = rounds
+        self.max_rounds = max_rounds
+        self.grid = bytearray(pathfinder.width * pathfinder.height)
+        for fruit in self.fruits:
+            self.grid[fruit] = CELL_FRUIT
+        for body in self.snakes.values():
+            for cell in body:
+                self.grid[cell] += SEGMENT
+
+    @staticmethod
+    def from_state(state: SnakeState, pathfinder: Optional[Pathfinder] = None,
+                   max_rounds: int = sys.maxsize) -> 'SnakeSimulator':
+        """
+        :param pathfinder: reused if it fits the world of the state
+        """
+        pathfinder = Pathfinder.for_state(state, pathfinder)
+        snakes = {username: [state.cell_index(segment['x'], segment['y']) for segment in body]
+                  for (username, body) in state.game_state.get('players', {}).items() if len(body) > 0}
+        fruits = [state.cell_index(fruit['x'], fruit['y']) for fruit in state.game_state.get('fruits', [])]
+        return SnakeSimulator(pathfinder, snakes, [fruit for fruit in fruits if fruit >= 0], len(state.players),
+                              max_rounds=max_rounds)
+
+    def copy(self) -> 'SnakeSimulator':
+        copy = SnakeSimulator.__new__(SnakeSimulator)
+        copy.pathfinder = self.pathfinder
+        copy.snakes = {username: deque(body) for (username, body) in self.snakes.items()}
+        copy.fruits = set(self.fruits)
+        copy.players = self.players
+        copy.rounds = self.rounds
+        copy.max_rounds = self.max_rounds
+        copy.grid = bytearray(self.grid)
+        return copy
+
+    def step(self, moves: Dict[str, str]) -> tuple:
+        """
+        Play a round
+
+        :param moves: username -> move, for every snake alive
+        :return: the record of the round, to give to undo
+        """
+        grid = self.grid
+        steps = self.pathfinder.steps
+        moved = []
+        for (username, body) in self.snakes.items():
+            head = steps[moves[username]][body[0]]
+            if head < 0:
+                # Out of the world: the snake dies, but its tail has moved on as for the others
+                tail = body.pop()
+                grid[tail] -= SEGMENT
+                moved.append((username, head, False, tail))
+                continue
+            body.appendleft(head)
+            grew = grid[head] & CELL_FRUIT
+            if grew:
+                grid[head] += SEGMENT - CELL_FRUIT
+                self.fruits.discard(head)
+                tail = -1
+            else:
+                grid[head] += SEGMENT
+                tail = body.pop()
+                grid[tail] -= SEGMENT
+            moved.append((username, head, grew, tail))
+        removed = []
+        for (username, head, _, _) in moved:
+            if head < 0 or grid[head] >= COLLISION:
+                removed.append((username, self.snakes[username]))
+        for (username, body) in removed:
+            del self.snakes[username]
+            for cell in body:
+                grid[cell] -= SEGMENT
+        self.rounds += 1
+        return (moved, removed)
+
+    def undo(self, record: tuple):
+        """ Take back the round of [record], which must be the last one played """
+        (moved, removed) = record
+        grid = self.grid
+        self.rounds -= 1
+        for (username, body) in removed:
+            self.snakes[username] = body
+            for cell in body:
+                grid[cell] += SEGMENT
+        for (username, head, grew, tail) in reversed(moved):
+            body = self.snakes[username]
+            if head < 0:
+                body.append(tail)
+                grid[tail] += SEGMENT
+                continue
+            body.popleft()
+            if grew:
+                grid[head] -= SEGMENT - CELL_FRUIT
+                self.fruits.add(head)
+            else:
+                grid[head] -= SEGMENT
+                body.append(tail)
+                grid[tail] += SEGMENT
+
+    def safe_moves(self, username: str) -> List[str]:
+        """ Moves of [username] to a cell that is free now. Empty if the snake is dead. """
+        body = self.snakes.get(username)
+        if body is None:
+            return []
+        grid = self.grid
+        head = body[0]
+        return [move for (move, step) in self.pathfinder.steps.items()
+                if step[head] >= 0 and grid[step[head]] <= CELL_FRUIT]
+
+    def is_over(self) -> bool:
+        return len(self.snakes) <= (0 if self.players == 1 else 1) or self.rounds >= self.max_rounds
+
+    def winners(self) -> List[str]:
+        """ The longest snakes alive, who win if the game is over """
+        longest = max((len(body) for body in self.snakes.values()), default=0)
+        return [username for (username, body) in self.snakes.items() if len(body) == longest]
+
+
+def evaluate(simulator: SnakeSimulator, username: str) -> float:
+    """
+    Score of the position for [username]: +/-WIN_SCORE for a won or lost game, earlier wins and later losses being
+    better, otherwise the difference of length with the longest other snake, then the room around the head and the
+    distance to the closest fruit
+    """
+    if username not in simulator.snakes:
+        return -WIN_SCORE + simulator.rounds
+    others = [len(body) for (other, body) in simulator.snakes.items() if other != username]
+    if simulator.is_over() or (simulator.players > 1 and len(others) == 0):
+        if username in simulator.winners():
+            return WIN_SCORE - simulator.rounds
+        return -WIN_SCORE + simulator.rounds
+    body = simulator.snakes[username]
+    length = len(body)
+    pathfinder = simulator.pathfinder
+    grid = simulator.grid
+    head = body[0]
+    space = max((pathfinder.flood_fill(grid, step[head], 2 * length) for step in pathfinder.steps.values()
+                 if step[head] >= 0), default=0)
+    score = 100.0 * (length - max(others, default=0)) + 10.0 * space
+    if space < length:
+        # Probably trapped
+        score -= 50.0 * length
+    if len(simulator.fruits) > 0:
+        distance = pathfinder.distance_field(grid, list(simulator.fruits), [head])[head]
+        if distance != UNREACHABLE:
+            score -= distance
+    return score
+
+
+def random_playouts(simulator: SnakeSimulator, username: str, move: str, count: int, depth: int,
+                    rng: random.Random) -> float:
+    """
+    Simulate many possible futures after [username] plays [move]: in each of them, the other snakes play random safe
+    moves, and then every snake does, for [depth] rounds in all. The simulator is left as it was.
+
+    :return: the average score of the futures, see evaluate
+    """
+    total = 0.0
+    moves = list(DIRECTIONS)
+    for _ in range(count):
+        records = []
+        for round_ in range(depth):
+            if simulator.is_over() or username not in simulator.snakes:
+                break
+            joint = {}
+            for other in simulator.snakes:
+                safe = simulator.safe_moves(other)
+                joint[other] = rng.choice(safe) if len(safe) > 0 else rng.choice(moves)
+            if round_ == 0:
+                joint[username] = move
+            records.append(simulator.step(joint))
+        total += evaluate(simulator, username)
+        for record in reversed(records):
+            simulator.undo(record)
+    return total / count
+
+
+def joint_moves(simulator: SnakeSimulator, usernames: List[str]) -> List[Dict[str, str]]:
+    """
+    :return: every combination of moves of [usernames], each snake only playing safe moves, or one move if it has
+             none since it dies anyway
+    """
+    combinations = [{}]
+    for username in usernames:
+        moves = simulator.safe_moves(username) or ['up']
+        combinations = [dict(combination, **{username: move}) for combination in combinations for move in moves]
+    return combinations
+
+
+def search_depth(simulator: SnakeSimulator, username: str, depth: int, deadline: float,
+                 clock) -> List[Tuple[str, float]]:
+    """
+    Paranoid search: [username] chooses its move, then the other snakes choose theirs to do it the most harm, for
+    [depth] rounds, with alpha-beta pruning
+
+    :param deadline: time, as given by clock(), at which the search is abandoned by raising TimeoutError
+    :return: the value of each move of [username]
+    """
+    def max_value(depth, alpha, beta):
+        if depth == 0 or simulator.is_over() or username not in simulator.snakes:
+            return evaluate(simulator, username)
+        best = -float('inf')
+        for move in simulator.safe_moves(username) or ['up']:
+            best = max(best, min_value(move, depth, alpha, beta))
+            alpha = max(alpha, best)
+            if alpha >= beta:
+                break
+        return best
+
+    def min_value(move, depth, alpha, beta):
+        if clock() > deadline:
+            raise TimeoutError
+        worst = float('inf')
+        others = [other for other in simulator.snakes if other != username]
+        for joint in joint_moves(simulator, others):
+            joint[username] = move
+            record = simulator.step(joint)
+            try:
+                worst = min(worst, max_value(depth - 1, alpha, beta))
+            finally:
+                simulator.undo(record)
+            beta = min(beta, worst)
+            if alpha >= beta:
+                break
+        return worst
+
+    return [(move, min_value(move, depth, -float('inf'), float('inf')))
+            for move in simulator.safe_moves(username) or list(DIRECTIONS)]
@@ -1,5 +1,17 @@
+from dataclasses import dataclass
+from typing import List, Optional
+
 import clientlib.wrapper as wrapper
 
+# (dx, dy) of each move
+DIRECTIONS = {"right": (1, 0), "left": (-1, 0), "up": (0, 1), "down": (0, -1)}
+
+# What is in each cell of the occupancy grid of a SnakeState
+CELL_EMPTY = 0
+CELL_FRUIT = 1
+CELL_HEAD = 2
+CELL_BODY = 3
+
 
 class SnakeMoveValidationError(Exception):
     def __init__(self, move_):
@@ -19,17 +31,95 @@ class SnakeMove(wrapper.GenericGameMove):
         }
 
 
+@dataclass(frozen=True)
+class SnakeMoved(wrapper.StateChange):
+    """ The snake of [player] has moved its head to [head] ({'x': x, 'y': y}), growing if [grew] """
+    player: str
+    head: dict
+    grew: bool
+
+
+@dataclass(frozen=True)
+class SnakeRemoved(wrapper.StateChange):
+    """ The snake of [player] isn't in the world anymore """
+    player: str
+
+
+@dataclass(frozen=True)
+class FruitEaten(wrapper.StateChange):
+    """ The fruit at [position] has been eaten by the snake of [player] """
+    player: str
+    position: dict
+
+
+@dataclass(frozen=True)
+class FruitRemoved(wrapper.StateChange):
+    """ The fruit at [position] has disappeared without any snake eating it """
+    position: dict
+
+
+@dataclass(frozen=True)
+class FruitAdded(wrapper.StateChange):
+    position: dict
+
+
 class SnakeState(wrapper.GenericGameState):
 
     def __init__(self):
         super(SnakeState, self).__init__()
         self.world_min = None
         self.world_max = None
+        # Occupancy grid of the world: CELL_* of cell (x, y) at cell_index(x, y), rebuilt on every update
+        self.width = 0
+        self.height = 0
+        self.grid = bytearray()
 
-    def update_game_state(self, encoded_game_state: dict):
-        super(SnakeState, self).update_game_state(encoded_game_state)
+    def apply_game_state(self, encoded_game_state: dict):
+        super(SnakeState, self).apply_game_state(encoded_game_state)
         self.world_min = self.game_state['world_min']
         self.world_max = self.game_state['world_max']
+        self._build_grid()
+
+    def _build_grid(self):
+        width = self.world_max['x'] - self.world_min['x'] + 1
+        height = self.world_max['y'] - self.world_min['y'] + 1
+        if (width, height) != (self.width, self.height):
+            (self.width, self.height) = (width, height)
+            self.grid = bytearray(width * height)
+        else:
+            self.grid[:] = bytes(width * height)
+        grid = self.grid
+        for fruit in self.game_state.get('fruits', []):
+            index = self.cell_index(fruit['x'], fruit['y'])
+            if index >= 0:
+                grid[index] = CELL_FRUIT
+        for body in self.game_state.get('players', {}).values():
+            for (i, segment) in enumerate(body):
+                index = self.cell_index(segment['x'], segment['y'])
+                if index >= 0:
+                    grid[index] = CELL_HEAD if i == 0 else CELL_BODY
+
+    def diff_game_state(self, encoded_game_state: dict) -> List[wrapper.StateChange]:
+        changes = super(SnakeState, self).diff_game_state(encoded_game_state)
+        old_players = self.game_state.get('players', {})
+        new_players = encoded_game_state['payload'].get('players', {})
+        heads = {}
+        for (username, body) in new_players.items():
+            if len(body) == 0:
+                continue
+            heads[(body[0]['x'], body[0]['y'])] = username
+            old_body = old_players.get(username)
+            if old_body is not None and len(old_body) > 0 and old_body[0] != body[0]:
+                changes.append(SnakeMoved(username, body[0], len(body) > len(old_body)))
+        changes += [SnakeRemoved(username) for username in old_players if username not in new_players]
+        old_fruits = self.game_state.get('fruits', [])
+        new_fruits = encoded_game_state['payload'].get('fruits', [])
+        for fruit in old_fruits:
+            if fruit not in new_fruits:
+                eater = heads.get((fruit['x'], fruit['y']))
+                changes.append(FruitEaten(eater, fruit) if eater is not None else FruitRemoved(fruit))
+        changes += [FruitAdded(fruit) for fruit in new_fruits if fruit not in old_fruits]
+        return changes
 
     def valid_moves(self, username: str):
         moves = []
@@ -41,6 +131,39 @@ class SnakeState(wrapper.GenericGameState):
                 moves.append("left")
             if players[username][0]["y"] > self.world_min['y']:
                 moves.append("down")
-            if players[username][0]["y"] < self.world_max['x']:
+            if players[username][0]["y"] < self.world_max['y']:
                 moves.append("up")
         return moves
+
+    def cell_index(self, x: int, y: int) -> int:
+        """ :return: index of cell (x, y) in the grid, or -1 if it is outside the world """
+        x -= self.world_min['x']
+        y -= self.world_min['y']
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return y * self.width + x
+        return -1
+
+    def is_free(self, x: int, y: int) -> bool:
+        """ Whether cell (x, y) is in the world and not taken by a snake. Cells with a fruit are free. """
+        index = self.cell_index(x, y)
+        return index >= 0 and self.grid[index] <= CELL_FRUIT
+
+    def safe_moves(self, username: str) -> List[str]:
+        """
+        Moves of [username] that don't run into a wall or a snake as the world is now. The tails of the snakes are
+        taken as occupied, although they move away unless the snake grows, and so are the heads of the other snakes.
+        """
+        body = self.game_state.get("players", {}).get(username)
+        if not body:
+            return []
+        head = body[0]
+        return [move for (move, (dx, dy)) in DIRECTIONS.items() if self.is_free(head['x'] + dx, head['y'] + dy)]
+
+    def nearest_fruit(self, username: str) -> Optional[dict]:
+        """ :return: the fruit closest to the head of [username] in moves, ignoring obstacles, or None """
+        body = self.game_state.get("players", {}).get(username)
+        fruits = self.game_state.get("fruits", [])
+        if not body or len(fruits) == 0:
+            return None
+        head = body[0]
+        return min(fruits, key=lambda fruit: abs(fruit['x'] - head['x']) + abs(fruit['y'] - head['y']))